@@ -1,28 +1,49 @@
 import os
+import io
+import csv
+import json
+import zlib
 import sqlite3
-import hashlib
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import sys
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash,
+                   stream_with_context)
 from datetime import date
 from functools import wraps
 
+# db, metrics, migrations and passwords live in ../shared, used by both apps
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+import metrics
+from db import ConnectionPool
+from migrations import migrate
+from passwords import PasswordCheckBusy, check_password, hash_password, hash_password_bounded
+
 app = Flask(__name__)
 app.secret_key = "secret123"
 
 # ---------- Database Path ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "bus.db")
+DB_PATH = os.environ.get("BUS_DB", os.path.join(BASE_DIR, "bus.db"))
+db = ConnectionPool(DB_PATH, row_factory=sqlite3.Row)
+db.init_app(app)
+metrics.init_app(app)
 
-# ---------- Helper Functions ----------
-def hash_password(password):
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+ATTENDANCE_STATUSES = ("Present", "Absent")
+ATTENDANCE_PAGE_SIZE = 100
+MAX_ATTENDANCE_PAGE_SIZE = 500
+IMPORT_CHUNK_SIZE = 1000  # Rows validated and inserted per batch during CSV import
+MAX_IMPORT_ERRORS_SHOWN = 1000
+EXPORT_BATCH_SIZE = 1000  # Rows fetched from the cursor per chunk of an export
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+STREAM_BUFFER_FRAGMENTS = 1000  # Template fragments per streamed write, about 90 attendance rows
 
+# ---------- Helper Functions ----------
 def get_db_connection():
-    """Get database connection with error handling"""
+    """Get the request's pooled database connection with error handling"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return db.get_db()
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
@@ -37,75 +58,312 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# ---------- Database Setup ----------
-def init_db():
-    """Initialize database with proper error handling and migration"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            raise Exception("Could not connect to database")
-            
-        cur = conn.cursor()
-        
-        # Check if users table exists and get its structure
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        users_table_exists = cur.fetchone()
-        
-        if users_table_exists:
-            # Check if email column exists
-            cur.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cur.fetchall()]
-            
-            if 'email' not in columns:
-                print("Migrating database: Adding email column to users table...")
-                cur.execute("ALTER TABLE users ADD COLUMN email TEXT")
-                cur.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                # Update existing admin user with email
-                cur.execute("UPDATE users SET email = 'admin@example.com' WHERE username = 'admin'")
-                conn.commit()
-                print("Database migration completed!")
+class AttendancePage:
+    """Streams one page of attendance rows and remembers where the next page starts"""
+    
+    def __init__(self, cursor, limit, filters):
+        self.cursor = cursor
+        self.limit = limit
+        self.filters = filters
+        self.last = None
+        self.has_more = False
+    
+    def __iter__(self):
+        # The query asks for one extra row to find out whether another page exists
+        for count, row in enumerate(self.cursor):
+            if count == self.limit:
+                self.has_more = True
+                break
+            self.last = row
+            yield row
+    
+    def next_args(self):
+        """Query arguments for the following page"""
+        return dict(self.filters, limit=self.limit, after_date=self.last['date'],
+                    after_student=self.last['student_id'])
+
+def attendance_filters():
+    """Non-empty attendance filters from the query string"""
+    filters = {key: request.args.get(key, "").strip()
+               for key in ("date_from", "date_to", "bus_no", "status")}
+    return {key: value for key, value in filters.items() if value}
+
+def attendance_conditions(filters):
+    """SQL conditions and parameters for attendance_filters()"""
+    conditions = []
+    params = []
+    if "date_from" in filters:
+        conditions.append("attendance.date >= ?")
+        params.append(filters["date_from"])
+    if "date_to" in filters:
+        conditions.append("attendance.date <= ?")
+        params.append(filters["date_to"])
+    if "bus_no" in filters:
+        conditions.append("students.bus_no = ?")
+        params.append(filters["bus_no"])
+    if "status" in filters:
+        conditions.append("attendance.status = ?")
+        params.append(filters["status"])
+    return conditions, params
+
+def stream_buffered_template(template_name, **context):
+    """Like flask.stream_template, but grouping Jinja's fragments into STREAM_BUFFER_FRAGMENTS per write
+
+    Unbuffered, every fragment between two template tags becomes its own chunk on the wire.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_FRAGMENTS)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+# ---------- Attendance Export ----------
+def export_rows(cur, fmt):
+    """Yield the export body in chunks of EXPORT_BATCH_SIZE rows"""
+    columns = [column[0] for column in cur.description]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        # Sent on its own so an export matching no rows is still a valid CSV file
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    while True:
+        rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            break
+        if fmt == "csv":
+            writer.writerows(rows)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
         else:
-            # Create users table from scratch
-            cur.execute("""CREATE TABLE users (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            username TEXT UNIQUE NOT NULL,
-                            email TEXT UNIQUE NOT NULL,
-                            password TEXT NOT NULL,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
-
-        # Create students table
-        cur.execute("""CREATE TABLE IF NOT EXISTS students (
+            chunk = "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+        yield chunk
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into a single gzip stream"""
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+# ---------- Student Import ----------
+def import_students_csv(cur, stream):
+    """Stream students from a CSV file into the database in chunks
+
+    Returns (imported, errors) where errors is a list of (line, roll, message).
+    Earlier chunks are already inserted when a later chunk is checked, so
+    duplicate rolls across the file are caught by the same database lookup.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    missing = {"name", "roll", "bus_no"} - set(reader.fieldnames or [])
+    if missing:
+        return 0, [(1, "", f"Missing column(s): {', '.join(sorted(missing))}")]
+    
+    imported = 0
+    errors = []
+    chunk = []
+    
+    def flush(chunk):
+        rolls = [roll for _, _, roll, _ in chunk]
+        placeholders = ",".join("?" * len(rolls))
+        cur.execute(f"SELECT roll FROM students WHERE roll IN ({placeholders})", rolls)
+        existing = {row[0] for row in cur.fetchall()}
+        rows = []
+        for line, name, roll, bus_no in chunk:
+            if roll in existing:
+                errors.append((line, roll, "Roll number already exists"))
+                continue
+            existing.add(roll)  # Also rejects repeats inside this chunk
+            rows.append((name, roll, bus_no))
+        cur.executemany("INSERT INTO students(name, roll, bus_no) VALUES(?, ?, ?)", rows)
+        return len(rows)
+    
+    for record in reader:
+        name = (record.get("name") or "").strip()
+        roll = (record.get("roll") or "").strip()
+        bus_no = (record.get("bus_no") or "").strip()
+        if not all([name, roll, bus_no]):
+            errors.append((reader.line_num, roll, "Name, roll and bus number are required"))
+            continue
+        chunk.append((reader.line_num, name, roll, bus_no))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            imported += flush(chunk)
+            chunk = []
+    if chunk:
+        imported += flush(chunk)
+    return imported, errors
+
+# ---------- Attendance Summaries ----------
+def rebuild_attendance_summaries(cur):
+    """Recompute every summary table from the raw attendance rows"""
+    present = "SUM(attendance.status = 'Present')"
+    absent = "SUM(attendance.status != 'Present')"
+    cur.execute("DELETE FROM student_attendance_summary")
+    cur.execute("DELETE FROM bus_daily_attendance")
+    cur.execute("DELETE FROM monthly_attendance")
+    cur.execute(f"""INSERT INTO student_attendance_summary(student_id, present, absent)
+                    SELECT student_id, {present}, {absent} FROM attendance GROUP BY student_id""")
+    cur.execute(f"""INSERT INTO bus_daily_attendance(bus_no, date, present, absent)
+                    SELECT students.bus_no, attendance.date, {present}, {absent}
+                    FROM attendance JOIN students ON students.id = attendance.student_id
+                    GROUP BY students.bus_no, attendance.date""")
+    # Months roll up from the per-day table rather than rescanning attendance
+    cur.execute("""INSERT INTO monthly_attendance(month, bus_no, present, absent)
+                   SELECT substr(date, 1, 7), bus_no, SUM(present), SUM(absent)
+                   FROM bus_daily_attendance GROUP BY substr(date, 1, 7), bus_no""")
+
+def update_attendance_summaries(cur, day, changes):
+    """Apply (student_id, bus_no, old_status, new_status) changes to the summary tables
+
+    Runs on the caller's cursor so the summaries commit in the same transaction
+    as the attendance rows themselves.
+    """
+    by_student = {}
+    by_bus = {}
+    for student_id, bus_no, old_status, new_status in changes:
+        for status, step in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            column = 0 if status == "Present" else 1
+            by_student.setdefault(student_id, [0, 0])[column] += step
+            by_bus.setdefault(bus_no, [0, 0])[column] += step
+    
+    cur.executemany("""INSERT INTO student_attendance_summary(student_id, present, absent) VALUES(?, ?, ?)
+                       ON CONFLICT(student_id) DO UPDATE SET present = present + excluded.present,
+                                                             absent = absent + excluded.absent""",
+                    [(student_id, p, a) for student_id, (p, a) in by_student.items()])
+    cur.executemany("""INSERT INTO bus_daily_attendance(bus_no, date, present, absent) VALUES(?, ?, ?, ?)
+                       ON CONFLICT(bus_no, date) DO UPDATE SET present = present + excluded.present,
+                                                               absent = absent + excluded.absent""",
+                    [(bus_no, day, p, a) for bus_no, (p, a) in by_bus.items()])
+    cur.executemany("""INSERT INTO monthly_attendance(month, bus_no, present, absent) VALUES(?, ?, ?, ?)
+                       ON CONFLICT(month, bus_no) DO UPDATE SET present = present + excluded.present,
+                                                                absent = absent + excluded.absent""",
+                    [(day[:7], bus_no, p, a) for bus_no, (p, a) in by_bus.items()])
+
+def attendance_percentage(present, absent):
+    total = present + absent
+    return round(100 * present / total, 1) if total else 0.0
+
+# ---------- Database Setup ----------
+def create_schema(cur):
+    """Users, students and attendance tables, upgrading users tables without email"""
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
+    if cur.fetchone():
+        cur.execute("PRAGMA table_info(users)")
+        columns = [column[1] for column in cur.fetchall()]
+        if 'email' not in columns:
+            cur.execute("ALTER TABLE users ADD COLUMN email TEXT")
+            cur.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+            # Update existing admin user with email
+            cur.execute("UPDATE users SET email = 'admin@example.com' WHERE username = 'admin'")
+    else:
+        cur.execute("""CREATE TABLE users (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        roll TEXT UNIQUE NOT NULL,
-                        bus_no TEXT NOT NULL,
+                        username TEXT UNIQUE NOT NULL,
+                        email TEXT UNIQUE NOT NULL,
+                        password TEXT NOT NULL,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
 
-        # Create attendance table
-        cur.execute("""CREATE TABLE IF NOT EXISTS attendance (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        student_id INTEGER NOT NULL,
-                        date TEXT NOT NULL,
-                        status TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY(student_id) REFERENCES students(id),
-                        UNIQUE(student_id, date))""")
-        
-        # Insert default admin user if not exists
-        admin_password = hash_password("admin123")
-        cur.execute("""INSERT OR IGNORE INTO users(username, email, password) 
-                       VALUES(?, ?, ?)""", ("admin", "admin@example.com", admin_password))
-        
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully!")
-        
+    cur.execute("""CREATE TABLE IF NOT EXISTS students (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    roll TEXT UNIQUE NOT NULL,
+                    bus_no TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+
+    cur.execute("""CREATE TABLE IF NOT EXISTS attendance (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    student_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(student_id) REFERENCES students(id),
+                    UNIQUE(student_id, date))""")
+
+def enforce_unique_attendance(cur):
+    """Older databases created attendance without UNIQUE(student_id, date)"""
+    cur.execute("PRAGMA index_list(attendance)")
+    unique_indexes = [index[1] for index in cur.fetchall() if index[2]]
+    unique_columns = []
+    for index_name in unique_indexes:
+        cur.execute(f"PRAGMA index_info({index_name})")
+        unique_columns.append([column[2] for column in cur.fetchall()])
+    if ["student_id", "date"] not in unique_columns:
+        cur.execute("""DELETE FROM attendance WHERE id NOT IN
+                       (SELECT MAX(id) FROM attendance GROUP BY student_id, date)""")
+        cur.execute("CREATE UNIQUE INDEX idx_attendance_student_date ON attendance(student_id, date)")
+
+def create_attendance_summaries(cur):
+    """Summary tables kept up to date by mark_attendance, backfilled once"""
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='student_attendance_summary'")
+    summaries_exist = cur.fetchone()
+    cur.execute("""CREATE TABLE IF NOT EXISTS student_attendance_summary (
+                    student_id INTEGER PRIMARY KEY,
+                    present INTEGER NOT NULL DEFAULT 0,
+                    absent INTEGER NOT NULL DEFAULT 0)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS bus_daily_attendance (
+                    bus_no TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    present INTEGER NOT NULL DEFAULT 0,
+                    absent INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY(bus_no, date))""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS monthly_attendance (
+                    month TEXT NOT NULL,
+                    bus_no TEXT NOT NULL,
+                    present INTEGER NOT NULL DEFAULT 0,
+                    absent INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY(month, bus_no))""")
+    if not summaries_exist:
+        rebuild_attendance_summaries(cur)
+
+def create_attendance_indexes(cur):
+    """Indexes for filtering and paging attendance records"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_students_bus_no ON students(bus_no)")
+
+def create_default_user(cur):
+    cur.execute("SELECT 1 FROM users WHERE username = 'admin'")
+    if not cur.fetchone():
+        cur.execute("""INSERT OR IGNORE INTO users(username, email, password)
+                       VALUES(?, ?, ?)""", ("admin", "admin@example.com", hash_password("admin123")))
+
+def index_attendance_pages(cur):
+    """view_attendance pages by (date, student_id); the index also covers date-only lookups"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_student ON attendance(date, student_id)")
+    cur.execute("DROP INDEX IF EXISTS idx_attendance_date")
+
+# Append only: the position in this list is the schema version (PRAGMA user_version)
+MIGRATIONS = [
+    ("Create users, students and attendance tables", create_schema),
+    ("Enforce one attendance row per student per day", enforce_unique_attendance),
+    ("Build attendance summaries", create_attendance_summaries),
+    ("Index attendance by date and students by bus", create_attendance_indexes),
+    ("Create the default admin user", create_default_user),
+    ("Index attendance by (date, student_id) for keyset paging", index_attendance_pages),
+]
+
+def init_db():
+    """Apply pending schema migrations; a single PRAGMA read when the database is current"""
+    try:
+        conn = db.acquire()
+        try:
+            migrate(conn, MIGRATIONS)
+        finally:
+            db.release(conn)
     except Exception as e:
         print(f"FATAL ERROR: Could not initialize database. {e}")
         raise
 
-# Initialize database
-init_db()
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending schema migrations (run once before starting the app)"""
+    init_db()
+    print("Database is up to date")
 
 # ---------- Routes ----------
 @app.route("/")
@@ -131,13 +389,15 @@ def login():
             
         try:
             cur = conn.cursor()
-            hashed_password = hash_password(password)
-            cur.execute("SELECT id, username, email FROM users WHERE username=? AND password=?", 
-                       (username, hashed_password))
+            cur.execute("SELECT id, username, email, password FROM users WHERE username=?", (username,))
             user = cur.fetchone()
-            conn.close()
+            valid, new_hash = check_password(password, user['password']) if user else (False, None)
             
-            if user:
+            if valid:
+                if new_hash:
+                    # Transparently upgrade legacy SHA-256 / plaintext passwords
+                    cur.execute("UPDATE users SET password=? WHERE id=?", (new_hash, user['id']))
+                    conn.commit()
                 session['user'] = {
                     'id': user['id'],
                     'username': user['username'],
@@ -147,12 +407,12 @@ def login():
                 return redirect(url_for("dashboard"))
             else:
                 flash("Invalid username or password.", "danger")
+        except PasswordCheckBusy:
+            flash("The server is busy. Please try again in a moment.", "warning")
+            return render_template("login.html"), 503
         except Exception as e:
             flash("Login error. Please try again.", "danger")
             print(f"Login error: {e}")
-        finally:
-            if conn:
-                conn.close()
     
     return render_template("login.html")
 
@@ -179,23 +439,22 @@ def signup():
             
         try:
             cur = conn.cursor()
-            hashed_password = hash_password(password)
+            hashed_password = hash_password_bounded(password)
             cur.execute("INSERT INTO users(username, email, password) VALUES(?, ?, ?)", 
                        (username, email, hashed_password))
             conn.commit()
-            conn.close()
             
             flash("Account created successfully! Please log in.", "success")
             return redirect(url_for("login"))
             
         except sqlite3.IntegrityError:
             flash("Username or email already exists.", "danger")
+        except PasswordCheckBusy:
+            flash("The server is busy. Please try again in a moment.", "warning")
+            return render_template("signup.html"), 503
         except Exception as e:
             flash("Registration error. Please try again.", "danger")
             print(f"Signup error: {e}")
-        finally:
-            if conn:
-                conn.close()
     
     return render_template("signup.html")
 
@@ -203,7 +462,18 @@ def signup():
 @login_required
 def dashboard():
     """Dashboard page"""
-    return render_template("dashboard.html")
+    today_by_bus = []
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT bus_no, present, absent FROM bus_daily_attendance WHERE date=? ORDER BY bus_no",
+                        (str(date.today()),))
+            today_by_bus = cur.fetchall()
+        except Exception as e:
+            print(f"Dashboard summary error: {e}")
+    return render_template("dashboard.html", today_by_bus=today_by_bus,
+                           percentage=attendance_percentage)
 
 @app.route("/add_student", methods=["POST"])
 @login_required
@@ -227,23 +497,57 @@ def add_student():
         cur.execute("INSERT INTO students(name, roll, bus_no) VALUES(?, ?, ?)", 
                    (name, roll, bus_no))
         conn.commit()
-        conn.close()
         flash("Student added successfully!", "success")
     except sqlite3.IntegrityError:
         flash("Student with this roll number already exists.", "danger")
     except Exception as e:
         flash("Error adding student. Please try again.", "danger")
         print(f"Add student error: {e}")
-    finally:
-        if conn:
-            conn.close()
     
     return redirect(url_for("dashboard"))
 
+@app.route("/import_students", methods=["GET", "POST"])
+@login_required
+def import_students():
+    """Bulk-add students from an uploaded CSV file (columns: name, roll, bus_no)"""
+    if request.method == "GET":
+        return render_template("import_students.html")
+    
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Please choose a CSV file to upload.", "danger")
+        return render_template("import_students.html")
+    
+    conn = get_db_connection()
+    if not conn:
+        flash("Database connection error. Please try again.", "danger")
+        return render_template("import_students.html")
+    
+    try:
+        imported, errors = import_students_csv(conn.cursor(), upload.stream)
+        conn.commit()
+    except (UnicodeDecodeError, csv.Error) as e:
+        conn.rollback()
+        flash("Could not read the file. Please upload a UTF-8 CSV file.", "danger")
+        print(f"Import students error: {e}")
+        return render_template("import_students.html")
+    except Exception as e:
+        conn.rollback()
+        flash("Error importing students. Please try again.", "danger")
+        print(f"Import students error: {e}")
+        return render_template("import_students.html")
+    
+    category = "warning" if errors else "success"
+    flash(f"Imported {imported} students, {len(errors)} rows rejected.", category)
+    return render_template("import_students.html", imported=imported, error_count=len(errors),
+                           errors=errors[:MAX_IMPORT_ERRORS_SHOWN])
+
 @app.route("/mark_attendance", methods=["GET", "POST"])
 @login_required
 def mark_attendance():
-    """Mark attendance page"""
+    """Mark attendance page, optionally for a single bus"""
+    bus_no = request.values.get("bus_no", "").strip()
+    today = str(date.today())
     conn = get_db_connection()
     if not conn:
         flash("Database connection error. Please try again.", "danger")
@@ -251,45 +555,52 @@ def mark_attendance():
     
     try:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM students ORDER BY name")
+        if bus_no:
+            cur.execute("SELECT * FROM students WHERE bus_no=? ORDER BY name", (bus_no,))
+        else:
+            cur.execute("SELECT * FROM students ORDER BY name")
         students = cur.fetchall()
-        conn.close()
         
         if request.method == "POST":
-            today = str(date.today())
-            conn = get_db_connection()
-            if not conn:
-                flash("Database connection error. Please try again.", "danger")
-                return redirect(url_for("dashboard"))
-            
+            # Each conductor submits only their own bus; re-submitting updates the day's rows
             try:
-                cur = conn.cursor()
-                
-                # Check if attendance already marked for today
-                cur.execute("SELECT COUNT(*) FROM attendance WHERE date=?", (today,))
-                if cur.fetchone()[0] > 0:
-                    flash("Attendance already marked for today!", "warning")
-                    return redirect(url_for("dashboard"))
-                
-                # Insert attendance records
+                # Take the write lock before reading the day's statuses so concurrent submissions
+                # (e.g. a double-click) compute their summary deltas one after the other
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute("SELECT student_id, status FROM attendance WHERE date=?", (today,))
+                previous = {row['student_id']: row['status'] for row in cur.fetchall()}
+                rows = []
+                changes = []
                 for student in students:
                     status = request.form.get(f"status_{student['id']}", "Absent")
-                    cur.execute("INSERT INTO attendance(student_id, date, status) VALUES(?, ?, ?)",
-                               (student['id'], today, status))
+                    if status not in ATTENDANCE_STATUSES:
+                        status = "Absent"
+                    rows.append((student['id'], today, status))
+                    old_status = previous.get(student['id'])
+                    if old_status != status:
+                        changes.append((student['id'], student['bus_no'], old_status, status))
                 
+                cur.executemany("""INSERT INTO attendance(student_id, date, status) VALUES(?, ?, ?)
+                                   ON CONFLICT(student_id, date) DO UPDATE SET status = excluded.status""",
+                                rows)
+                update_attendance_summaries(cur, today, changes)
                 conn.commit()
-                conn.close()
-                flash("Attendance marked successfully!", "success")
+                scope = f" for bus {bus_no}" if bus_no else ""
+                flash(f"Attendance saved for {len(rows)} students{scope}!", "success")
                 return redirect(url_for("dashboard"))
                 
             except Exception as e:
+                conn.rollback()
                 flash("Error marking attendance. Please try again.", "danger")
                 print(f"Mark attendance error: {e}")
-            finally:
-                if conn:
-                    conn.close()
         
-        return render_template("mark_attendance.html", students=students)
+        # Pre-select anything already marked today so a second submission is an edit
+        cur.execute("SELECT student_id, status FROM attendance WHERE date=?", (today,))
+        marked = {row['student_id']: row['status'] for row in cur.fetchall()}
+        cur.execute("SELECT DISTINCT bus_no FROM students ORDER BY bus_no")
+        buses = [row['bus_no'] for row in cur.fetchall()]
+        return render_template("mark_attendance.html", students=students, marked=marked,
+                               buses=buses, bus_no=bus_no)
         
     except Exception as e:
         flash("Error loading students. Please try again.", "danger")
@@ -299,7 +610,20 @@ def mark_attendance():
 @app.route("/view_attendance")
 @login_required
 def view_attendance():
-    """View attendance records"""
+    """View attendance records a page at a time (newest date first, then newest student)"""
+    filters = attendance_filters()
+    limit = min(max(request.args.get("limit", ATTENDANCE_PAGE_SIZE, type=int), 1), MAX_ATTENDANCE_PAGE_SIZE)
+    conditions, params = attendance_conditions(filters)
+    
+    # Keyset pagination: continue after the last (date, student_id) of the previous page.
+    # Both columns descend so idx_attendance_date_student serves the order and the seek.
+    after_date = request.args.get("after_date")
+    after_student = request.args.get("after_student", type=int)
+    if after_date is not None and after_student is not None:
+        conditions.append("(attendance.date, attendance.student_id) < (?, ?)")
+        params.extend([after_date, after_student])
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     conn = get_db_connection()
     if not conn:
         flash("Database connection error. Please try again.", "danger")
@@ -307,21 +631,80 @@ def view_attendance():
     
     try:
         cur = conn.cursor()
-        cur.execute("""SELECT students.name, students.roll, students.bus_no, 
-                              attendance.date, attendance.status
-                       FROM attendance
-                       JOIN students ON students.id = attendance.student_id
-                       ORDER BY attendance.date DESC, students.name""")
-        records = cur.fetchall()
-        conn.close()
-        return render_template("view_attendance.html", records=records)
+        cur.execute(f"""SELECT students.name, students.roll, students.bus_no,
+                               attendance.date, attendance.status, attendance.student_id
+                        FROM attendance
+                        JOIN students ON students.id = attendance.student_id
+                        {where}
+                        ORDER BY attendance.date DESC, attendance.student_id DESC
+                        LIMIT ?""", params + [limit + 1])
+        page = AttendancePage(cur, limit, filters)
+        # Rows are sent to the browser as they are read from the cursor
+        return stream_buffered_template("view_attendance.html", records=page, page=page,
+                                        filters=filters, statuses=ATTENDANCE_STATUSES)
     except Exception as e:
         flash("Error loading attendance records. Please try again.", "danger")
         print(f"View attendance error: {e}")
         return redirect(url_for("dashboard"))
-    finally:
-        if conn:
-            conn.close()
+
+@app.route("/reports")
+@login_required
+def reports():
+    """Attendance percentages by student, bus and month, read from the summary tables"""
+    conn = get_db_connection()
+    if not conn:
+        flash("Database connection error. Please try again.", "danger")
+        return redirect(url_for("dashboard"))
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("""SELECT students.name, students.roll, students.bus_no,
+                              student_attendance_summary.present, student_attendance_summary.absent
+                       FROM student_attendance_summary
+                       JOIN students ON students.id = student_attendance_summary.student_id
+                       ORDER BY students.name""")
+        by_student = cur.fetchall()
+        cur.execute("""SELECT bus_no, SUM(present) AS present, SUM(absent) AS absent
+                       FROM monthly_attendance GROUP BY bus_no ORDER BY bus_no""")
+        by_bus = cur.fetchall()
+        cur.execute("""SELECT month, SUM(present) AS present, SUM(absent) AS absent
+                       FROM monthly_attendance GROUP BY month ORDER BY month DESC""")
+        by_month = cur.fetchall()
+        return render_template("reports.html", by_student=by_student, by_bus=by_bus,
+                               by_month=by_month, percentage=attendance_percentage)
+    except Exception as e:
+        flash("Error loading reports. Please try again.", "danger")
+        print(f"Reports error: {e}")
+        return redirect(url_for("dashboard"))
+
+@app.route("/export/attendance")
+@login_required
+def export_attendance():
+    """Stream attendance as CSV or NDJSON, filtered like view_attendance"""
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return {"status": "error", "message": "format must be csv or ndjson"}, 400
+    conditions, params = attendance_conditions(attendance_filters())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    conn = get_db_connection()
+    if not conn:
+        return {"status": "error", "message": "Database connection error"}, 503
+    cur = conn.cursor()
+    cur.execute(f"""SELECT attendance.date, attendance.student_id, students.name, students.roll,
+                           students.bus_no, attendance.status
+                    FROM attendance
+                    JOIN students ON students.id = attendance.student_id
+                    {where}
+                    ORDER BY attendance.date, attendance.id""", params)
+    
+    body = export_rows(cur, fmt)
+    headers = {"Content-Disposition": f"attachment; filename=attendance.{fmt}", "Vary": "Accept-Encoding"}
+    if "gzip" in request.accept_encodings:
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    # stream_with_context keeps the request's connection open until the last row is sent
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt], headers=headers)
 
 @app.route("/logout")
 def logout():
@@ -331,4 +714,5 @@ def logout():
     return redirect(url_for("index"))
 
 if __name__ == "__main__":
+    init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
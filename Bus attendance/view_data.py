@@ -1,79 +1,154 @@
-import sqlite3
+import argparse
 import os
+import sqlite3
+from pathlib import Path
+
+DEFAULT_DB = "bus.db"
+PAGE_SIZE = 20
+CELL_WIDTH = 15
+MAX_CELL_CHARS = 40  # Long values (e.g. trip paths) are cut to this length
+
+def quote(name):
+    """Quote an identifier for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+def open_read_only(db_path):
+    """Open the database read-only so the viewer never takes a write lock"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+def format_cell(cell):
+    text = str(cell)
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS - 3] + "..."
+    return f"{text:{CELL_WIDTH}}"
+
+def list_tables(cur):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+    return [row[0] for row in cur.fetchall()]
+
+def table_columns(cur, table):
+    cur.execute(f"PRAGMA table_info({quote(table)})")
+    return [row[1] for row in cur.fetchall()]
+
+def count_rows(cur, table):
+    cur.execute(f"SELECT COUNT(*) FROM {quote(table)}")
+    return cur.fetchone()[0]
+
+def print_page(cur, table, columns, after, limit):
+    """Print up to `limit` rows with rowid > after, returning (last rowid printed or None, rows printed)"""
+    cur.execute(f"SELECT rowid, * FROM {quote(table)} WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit))
+    last_rowid = None
+    printed = 0
+    while True:
+        rows = cur.fetchmany(PAGE_SIZE)
+        if not rows:
+            break
+        if printed == 0:
+            print(" | ".join(f"{col:{CELL_WIDTH}}" for col in columns))
+            print("-" * (len(columns) * (CELL_WIDTH + 3)))
+        for row in rows:
+            print(" | ".join(format_cell(cell) for cell in row[1:]))
+            last_rowid = row[0]
+        printed += len(rows)
+    if printed == 0:
+        print("No data found")
+    return last_rowid, printed
+
+def print_stats(cur, table, columns, distinct=False):
+    """Row count plus per-column null count, min and max, computed in one SQL scan"""
+    selects = ["COUNT(*)"]
+    for col in columns:
+        selects += [f"COUNT({quote(col)})", f"MIN({quote(col)})", f"MAX({quote(col)})"]
+        if distinct:
+            selects.append(f"COUNT(DISTINCT {quote(col)})")
+    cur.execute(f"SELECT {', '.join(selects)} FROM {quote(table)}")
+    values = cur.fetchone()
+    total = values[0]
+    per_column = 4 if distinct else 3
+    headers = ["column", "nulls", "min", "max"] + (["distinct"] if distinct else [])
+    print(f"Rows: {total}")
+    print(" | ".join(f"{header:{CELL_WIDTH}}" for header in headers))
+    print("-" * (len(headers) * (CELL_WIDTH + 3)))
+    for index, col in enumerate(columns):
+        stats = values[1 + index * per_column:1 + (index + 1) * per_column]
+        cells = [col, total - stats[0], stats[1], stats[2]] + list(stats[3:])
+        print(" | ".join(format_cell(cell) for cell in cells))
+
+def show_table(cur, table, args):
+    print(f"📊 TABLE: {table.upper()}")
+    print("-" * 30)
+    columns = table_columns(cur, table)
+    print(f"Columns: {', '.join(columns)}")
+    if args.stats:
+        print_stats(cur, table, columns, args.distinct)
+    else:
+        print(f"Rows: {count_rows(cur, table)}")
+    print()
+
+    after = args.after
+    while True:
+        last_rowid, printed = print_page(cur, table, columns, after, args.limit)
+        if printed < args.limit:
+            break
+        if not args.interactive:
+            print(f"... next page: --table {table} --after {last_rowid}")
+            break
+        try:
+            if input("Enter for the next page, q to quit: ").strip().lower() == "q":
+                break
+        except (KeyboardInterrupt, EOFError):
+            break
+        after = last_rowid
+    print()
+    print("=" * 50)
+    print()
 
 def view_database():
-    """View all data in the bus attendance database"""
-    
-    # Database path
-    db_path = "bus.db"
-    
-    if not os.path.exists(db_path):
-        print("❌ Database file 'bus.db' not found!")
+    """View the tables of a bus attendance or transport tracking database"""
+    parser = argparse.ArgumentParser(description="Inspect a SQLite database without loading it into memory")
+    parser.add_argument("db_path", nargs="?", default=DEFAULT_DB,
+                        help="Database file, e.g. bus.db or '../transport tracking/transport.db'")
+    parser.add_argument("--table", help="Only show this table")
+    parser.add_argument("--limit", type=int, default=PAGE_SIZE, help="Rows per page")
+    parser.add_argument("--after", type=int, default=0, help="Start after this rowid (keyset paging)")
+    parser.add_argument("--interactive", action="store_true", help="Prompt to page through the rows")
+    parser.add_argument("--stats", action="store_true", help="Show null counts and min/max per column")
+    parser.add_argument("--distinct", action="store_true", help="Also count distinct values (slower)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ Database file '{args.db_path}' not found!")
         return
-    
+
     try:
-        # Connect to database
-        conn = sqlite3.connect(db_path)
+        conn = open_read_only(args.db_path)
         cur = conn.cursor()
-        
-        print("🗄️  BUS ATTENDANCE DATABASE VIEWER")
+
+        print(f"🗄️  DATABASE VIEWER: {args.db_path}")
         print("=" * 50)
-        
-        # Get table names
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cur.fetchall()
-        
+
+        tables = list_tables(cur)
         if not tables:
             print("❌ No tables found in database!")
             return
-        
-        print(f"📋 Found {len(tables)} table(s): {[table[0] for table in tables]}")
-        print()
-        
-        # View each table
-        for table in tables:
-            table_name = table[0]
-            print(f"📊 TABLE: {table_name.upper()}")
-            print("-" * 30)
-            
-            # Get table structure
-            cur.execute(f"PRAGMA table_info({table_name})")
-            columns = cur.fetchall()
-            column_names = [col[1] for col in columns]
-            
-            print(f"Columns: {', '.join(column_names)}")
-            
-            # Get all data
-            cur.execute(f"SELECT * FROM {table_name}")
-            rows = cur.fetchall()
-            
-            if rows:
-                print(f"Rows: {len(rows)}")
-                print()
-                
-                # Print header
-                print(" | ".join(f"{col:15}" for col in column_names))
-                print("-" * (len(column_names) * 18))
-                
-                # Print data (limit to 20 rows for readability)
-                for i, row in enumerate(rows[:20]):
-                    print(" | ".join(f"{str(cell):15}" for cell in row))
-                
-                if len(rows) > 20:
-                    print(f"... and {len(rows) - 20} more rows")
-            else:
-                print("No data found")
-            
+        if args.table:
+            if args.table not in tables:
+                print(f"❌ Table '{args.table}' not found! Tables: {tables}")
+                return
+            tables = [args.table]
+        else:
+            print(f"📋 Found {len(tables)} table(s): {tables}")
             print()
-            print("=" * 50)
-            print()
-        
+
+        for table in tables:
+            show_table(cur, table, args)
+
         conn.close()
         print("✅ Database view completed!")
-        
-    except Exception as e:
+
+    except sqlite3.Error as e:
         print(f"❌ Error viewing database: {e}")
 
 if __name__ == "__main__":
     view_database()
-
@@ -0,0 +1,60 @@
+import importlib
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSPORT_DIR = os.path.join(ROOT, "transport tracking")
+ATTENDANCE_DIR = os.path.join(ROOT, "Bus attendance")
+DATA_DIR = os.path.join(ROOT, "bench", "data")
+
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+BUS_COUNT_ATTENDANCE = 100  # Students are spread over this many bus numbers
+
+def load_app(directory, module_name):
+    """Import an app module, with its project directory on sys.path only while it imports"""
+    sys.path.insert(0, directory)
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.remove(directory)
+
+def load_transport(db_path):
+    os.environ["TRANSPORT_DB"] = db_path
+    module = load_app(TRANSPORT_DIR, "app_simple")
+    module.init_db()  # Migrations are applied explicitly, not at import
+    module.sync_eta_stats()  # Load learned segment times before measured requests
+    return module
+
+def load_attendance(db_path):
+    os.environ["BUS_DB"] = db_path
+    module = load_app(ATTENDANCE_DIR, "app")
+    module.init_db()
+    return module
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and tail latency (milliseconds) for one scenario"""
+    latencies = sorted(latencies)
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0
+    }
+    if latencies:
+        for pct in (50, 95, 99):
+            result[f"p{pct}_ms"] = round(percentile(latencies, pct) * 1000, 3)
+        result["max_ms"] = round(latencies[-1] * 1000, 3)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,175 @@
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from common import (BENCH_PASSWORD, BENCH_USER, DATA_DIR, git_commit, load_attendance,
+                    load_transport, summarize)
+
+def bus_rosters(bus_db):
+    """Student IDs per bus number, used to build mark_attendance forms"""
+    rosters = {}
+    with sqlite3.connect(bus_db) as conn:
+        for student_id, bus_no in conn.execute("SELECT id, bus_no FROM students"):
+            rosters.setdefault(bus_no, []).append(student_id)
+    return rosters
+
+def max_bus_id(transport_db):
+    with sqlite3.connect(transport_db) as conn:
+        return conn.execute("SELECT MAX(id) FROM buses").fetchone()[0] or 1
+
+def scenarios(bus_count, rosters):
+    """(name, app, needs_login, request_builder) for every hot route"""
+    bus_numbers = sorted(rosters)
+
+    def update_location(rng):
+        return "POST", "/api/update_location", {"json": {
+            "bus_id": rng.randint(1, bus_count),
+            "latitude": 12.9 + rng.uniform(-0.2, 0.2),
+            "longitude": 77.6 + rng.uniform(-0.2, 0.2)}}
+
+    def get_locations(rng):
+        return "GET", "/api/get_locations", {}
+
+    def mark_attendance(rng):
+        bus_no = rng.choice(bus_numbers)
+        form = {f"status_{student_id}": "Present" if rng.random() < 0.9 else "Absent"
+                for student_id in rosters[bus_no]}
+        form["bus_no"] = bus_no
+        return "POST", "/mark_attendance", {"data": form}
+
+    def view_attendance(rng):
+        return "GET", f"/view_attendance?bus_no={rng.choice(bus_numbers)}", {}
+
+    def login(rng):
+        return "POST", "/login", {"data": {"username": BENCH_USER, "password": BENCH_PASSWORD}}
+
+    return [
+        ("update_location", "transport", False, update_location),
+        ("get_locations", "transport", False, get_locations),
+        ("login", "attendance", False, login),
+        ("mark_attendance", "attendance", True, mark_attendance),
+        ("view_attendance", "attendance", True, view_attendance),
+    ]
+
+# ---------- Flask Test Client ----------
+def run_test_client(apps, name, app_key, needs_login, build, count, seed):
+    """Drive one route in-process, one request at a time"""
+    client = apps[app_key].test_client()
+    if needs_login:
+        client.post("/login", data={"username": BENCH_USER, "password": BENCH_PASSWORD})
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        method, path, kwargs = build(rng)
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()  # Drain streamed bodies
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+# ---------- Real HTTP ----------
+def serve(app):
+    """Start a threaded WSGI server on a free port, returning (server, base_url)"""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # No per-request access log
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run_http(urls, name, app_key, needs_login, build, count, concurrency, seed):
+    """Drive one route over HTTP with `concurrency` keep-alive clients"""
+    base_url = urls[app_key]
+    per_worker = [count // concurrency + (1 if index < count % concurrency else 0)
+                  for index in range(concurrency)]
+
+    def worker(index):
+        session = requests.Session()
+        if needs_login:
+            session.post(f"{base_url}/login", allow_redirects=False,
+                         data={"username": BENCH_USER, "password": BENCH_PASSWORD})
+        rng = random.Random(seed + index)
+        latencies = []
+        errors = 0
+        for _ in range(per_worker[index]):
+            method, path, kwargs = build(rng)
+            request_started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, allow_redirects=False, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+            latencies.append(time.perf_counter() - request_started)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for latencies, _ in results for latency in latencies],
+                     sum(errors for _, errors in results), elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot routes of both apps")
+    parser.add_argument("--data", default=DATA_DIR, help="Directory holding the seeded databases")
+    parser.add_argument("--mode", choices=("client", "http", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel clients in HTTP mode")
+    parser.add_argument("--routes", nargs="*", help="Only run these routes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Work on copies so every run starts from the same seeded state
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    transport_db = os.path.join(workdir, "transport.db")
+    bus_db = os.path.join(workdir, "bus.db")
+    shutil.copy(os.path.join(args.data, "transport.db"), transport_db)
+    shutil.copy(os.path.join(args.data, "bus.db"), bus_db)
+
+    try:
+        apps = {"transport": load_transport(transport_db).app, "attendance": load_attendance(bus_db).app}
+        selected = [scenario for scenario in scenarios(max_bus_id(transport_db), bus_rosters(bus_db))
+                    if not args.routes or scenario[0] in args.routes]
+        report = {"commit": git_commit(), "timestamp": int(time.time()),
+                  "requests_per_route": args.requests, "results": {}}
+
+        if args.mode in ("client", "both"):
+            report["results"]["test_client"] = {
+                name: run_test_client(apps, name, app_key, needs_login, build, args.requests, args.seed)
+                for name, app_key, needs_login, build in selected}
+
+        if args.mode in ("http", "both"):
+            servers = {key: serve(app) for key, app in apps.items()}
+            urls = {key: url for key, (_, url) in servers.items()}
+            report["results"]["http"] = {"concurrency": args.concurrency}
+            for name, app_key, needs_login, build in selected:
+                report["results"]["http"][name] = run_http(urls, name, app_key, needs_login, build,
+                                                           args.requests, args.concurrency, args.seed)
+            for server, _ in servers.values():
+                server.shutdown()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
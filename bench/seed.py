@@ -0,0 +1,115 @@
+import argparse
+import datetime
+import math
+import os
+import random
+import sqlite3
+import time
+
+from common import (BENCH_PASSWORD, BENCH_USER, BUS_COUNT_ATTENDANCE, DATA_DIR,
+                    load_attendance, load_transport)
+
+def fast_connection(app_module):
+    """Connection tuned for a one-off bulk load (no journal, no fsync)"""
+    # Close the app's pooled connections so the journal mode can be switched
+    while not app_module.db.idle.empty():
+        app_module.db.idle.get_nowait().close()
+    conn = sqlite3.connect(app_module.db.path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+    return conn
+
+def seed_transport(path, buses, locations, seed):
+    """Create transport.db with `buses` buses and `locations` fixes ending now"""
+    if os.path.exists(path):
+        os.remove(path)
+    app_module = load_transport(path)
+    rng = random.Random(seed)
+    
+    conn = fast_connection(app_module)
+    # Building indexes once after the load is much cheaper than maintaining them row by row
+    conn.execute("DROP INDEX idx_locations_bus_time")
+    conn.execute("DROP INDEX idx_locations_time")
+    conn.executemany("INSERT INTO buses (bus_number, route) VALUES (?, ?)",
+                     ((f"BUS-{bus_id:05d}", f"Route {bus_id % 50}") for bus_id in range(1, buses + 1)))
+    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                 (BENCH_USER, app_module.hash_password(BENCH_PASSWORD)))
+    
+    # Every bus reports every 3 seconds, walking a circle around its own centre
+    ticks = math.ceil(locations / buses)
+    start = int(time.time()) - ticks * 3
+    centres = [(12.9 + rng.uniform(-0.2, 0.2), 77.6 + rng.uniform(-0.2, 0.2)) for _ in range(buses)]
+    
+    def rows():
+        for index in range(locations):
+            tick, bus = divmod(index, buses)
+            lat, lon = centres[bus]
+            angle = tick / 200
+            yield bus + 1, lat + 0.01 * math.cos(angle), lon + 0.01 * math.sin(angle), start + tick * 3
+    
+    conn.executemany("INSERT INTO locations (bus_id, latitude, longitude, timestamp) VALUES (?,?,?,?)", rows())
+    conn.commit()
+    app_module.create_location_indexes(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def seed_attendance(path, students, days, seed):
+    """Create bus.db with `students` students and `days` days of weekday attendance"""
+    if os.path.exists(path):
+        os.remove(path)
+    app_module = load_attendance(path)
+    
+    conn = fast_connection(app_module)
+    conn.execute("DROP INDEX idx_attendance_date_student")
+    conn.execute("INSERT INTO users(username, email, password) VALUES(?, ?, ?)",
+                 (BENCH_USER, "bench@example.com", app_module.hash_password(BENCH_PASSWORD)))
+    conn.executemany("INSERT INTO students(name, roll, bus_no) VALUES(?, ?, ?)",
+                     ((f"Student {index:06d}", f"R{index:06d}", str(index % BUS_COUNT_ATTENDANCE + 1))
+                      for index in range(students)))
+    
+    today = datetime.date.today()
+    school_days = [today - datetime.timedelta(days=offset) for offset in range(days, 0, -1)]
+    conn.execute("CREATE TEMP TABLE school_days (n INTEGER PRIMARY KEY, date TEXT)")
+    conn.executemany("INSERT INTO school_days (date) VALUES (?)",
+                     ((str(day),) for day in school_days if day.weekday() < 5))
+    
+    # Generated inside SQLite: binding millions of rows from Python dominates the load time.
+    # Student-major order appends to the UNIQUE(student_id, date) index instead of scattering,
+    # and a cheap hash of (student, day, seed) marks about 10% of rows Absent.
+    conn.execute("""INSERT INTO attendance(student_id, date, status)
+                    SELECT students.id, school_days.date,
+                           CASE WHEN (students.id * 7919 + school_days.n * 104729 + ?) % 100 < 10
+                                THEN 'Absent' ELSE 'Present' END
+                    FROM students CROSS JOIN school_days
+                    ORDER BY students.id, school_days.n""", (seed,))
+    conn.execute("CREATE INDEX idx_attendance_date_student ON attendance(date, student_id)")
+    app_module.rebuild_attendance_summaries(conn.cursor())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed benchmark databases with bulk inserts")
+    parser.add_argument("--out", default=DATA_DIR, help="Directory for transport.db and bus.db")
+    parser.add_argument("--buses", type=int, default=2000)
+    parser.add_argument("--locations", type=int, default=2_000_000)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=365, help="Calendar days of attendance (weekdays only)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible data")
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    
+    started = time.perf_counter()
+    seed_transport(os.path.join(args.out, "transport.db"), args.buses, args.locations, args.seed)
+    print(f"Seeded transport.db: {args.buses} buses, {args.locations} locations "
+          f"({time.perf_counter() - started:.1f}s)")
+    
+    started = time.perf_counter()
+    seed_attendance(os.path.join(args.out, "bus.db"), args.students, args.days, args.seed)
+    print(f"Seeded bus.db: {args.students} students, {args.days} days of attendance "
+          f"({time.perf_counter() - started:.1f}s)")
+
+if __name__ == "__main__":
+    main()
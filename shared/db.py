@@ -0,0 +1,82 @@
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+from metrics import InstrumentedConnection, metrics
+
+# ---------- Connection Settings ----------
+BUSY_TIMEOUT_MS = 5000  # Wait this long for a lock instead of failing immediately
+CACHED_STATEMENTS = 256  # Prepared statements kept per connection
+
+class ConnectionPool:
+    """Pool of SQLite connections configured for concurrent readers and writers"""
+
+    def __init__(self, path, size=8, row_factory=None):
+        self.path = path
+        self.row_factory = row_factory
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=CACHED_STATEMENTS,
+                               factory=InstrumentedConnection,
+                               check_same_thread=False)  # Handed between request threads
+        conn.row_factory = self.row_factory
+        # WAL lets readers keep going while a writer commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        metrics.observe("sqlite_connection_open_seconds", "Time to open and configure a SQLite connection",
+                        time.perf_counter() - started)
+        return conn
+
+    def acquire(self):
+        """Take an idle connection from the pool, opening a new one if none is free"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        if conn.in_transaction:
+            conn.rollback()  # Never hand out a connection mid-transaction
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def get_db(self):
+        """Connection bound to the current request, returned by the teardown hook"""
+        if "db_conn" not in g:
+            g.db_conn = self.acquire()
+        return g.db_conn
+
+    def close_db(self, exception=None):
+        conn = g.pop("db_conn", None)
+        if conn is not None:
+            self.release(conn)
+
+    def init_app(self, app):
+        app.teardown_appcontext(self.close_db)
+
+    @contextmanager
+    def connection(self):
+        """Like `with sqlite3.connect(...)`: commit on success, roll back on error"""
+        in_request = has_app_context()
+        conn = self.get_db() if in_request else self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            if not in_request:
+                self.release(conn)
@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+# ---------- Settings ----------
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SLOW_REQUEST_SECONDS = 0.5  # Requests slower than this are logged with their SQL; None disables
+MAX_LOGGED_STATEMENTS = 50
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {self.total}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.total}")
+        return lines
+
+class Metrics:
+    """Thread-safe registry of counters, histograms and gauges in Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}  # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.gauges = {}  # name -> callable returning the current value
+
+    def inc(self, name, help_text, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help_text)
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, help_text, value, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help_text)
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def gauge(self, name, help_text, func):
+        """Register a gauge whose value is read from func() at scrape time"""
+        with self.lock:
+            self.help[name] = help_text
+            self.gauges[name] = func
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} counter"]
+                lines += [f"{name}{_format_labels(labels)} {value}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(series.items()):
+                    lines += histogram.render(name, labels)
+            gauges = sorted(self.gauges.items())
+        for name, func in gauges:
+            lines += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} gauge", f"{name} {func()}"]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+# ---------- SQLite Instrumentation ----------
+def record_query(sql, elapsed):
+    metrics.observe("sqlite_query_duration_seconds", "Time spent executing SQLite statements", elapsed)
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+        g.query_time = g.get("query_time", 0.0) + elapsed
+        statements = g.setdefault("statements", [])
+        if len(statements) < MAX_LOGGED_STATEMENTS:
+            statements.append((" ".join(sql.split()), elapsed))
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are timed and counted per request"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# ---------- Flask Integration ----------
+def _before_request():
+    g.request_started = time.perf_counter()
+
+def _after_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or "unknown"
+    query_count = g.get("query_count", 0)
+    metrics.inc("http_requests_total", "HTTP requests handled",
+                endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe("http_request_duration_seconds", "Time to produce a response (excludes streamed bodies)",
+                    elapsed, endpoint=endpoint, method=request.method)
+    metrics.observe("http_request_sqlite_queries", "SQLite statements executed per request",
+                    query_count, buckets=QUERY_COUNT_BUCKETS, endpoint=endpoint)
+    metrics.observe("http_request_sqlite_seconds", "SQLite time spent per request",
+                    g.get("query_time", 0.0), endpoint=endpoint)
+    if SLOW_REQUEST_SECONDS is not None and elapsed >= SLOW_REQUEST_SECONDS:
+        print(f"Slow request: {request.method} {request.path} took {elapsed * 1000:.1f} ms "
+              f"({query_count} queries, {g.get('query_time', 0.0) * 1000:.1f} ms in SQLite)")
+        for sql, query_elapsed in g.get("statements", []):
+            print(f"    {query_elapsed * 1000:8.2f} ms  {sql}")
+    return response
+
+def init_app(app):
+    """Record request metrics for every route and serve them at /metrics"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics",
+                     lambda: Response(metrics.render(), mimetype="text/plain; version=0.0.4"))
@@ -0,0 +1,42 @@
+# ---------- Schema Migrations ----------
+# A migration is a (description, function) pair; the function receives a cursor
+# and must not commit. Migration N leaves the database at PRAGMA user_version N,
+# so the list may only ever be appended to.
+
+class SchemaTooNew(Exception):
+    """Raised when the database was migrated by a newer version of the app"""
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, migrations):
+    """Apply any migrations the database has not seen yet, returning the final version
+
+    When the database is current this is a single PRAGMA read. Otherwise the
+    pending migrations run in one exclusive transaction, so concurrent workers
+    starting together wait for the first one instead of migrating twice.
+    """
+    target = len(migrations)
+    version = schema_version(conn)
+    if version == target:
+        return version
+    if version > target:
+        raise SchemaTooNew(f"Database schema version {version} is newer than this app ({target})")
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN EXCLUSIVE")
+    try:
+        # Another process may have finished migrating while we waited for the lock
+        version = schema_version(conn)
+        c = conn.cursor()
+        for number in range(version + 1, target + 1):
+            description, apply = migrations[number - 1]
+            print(f"Applying migration {number}: {description}")
+            apply(c)
+            c.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return target
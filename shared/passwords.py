@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------- Hashing Settings ----------
+PBKDF2_ALGORITHM = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = 260000  # Raise over time; older hashes are upgraded on login
+SALT_BYTES = 16
+
+# At most this many hashes are computed at once; further logins are turned away
+HASH_WORKERS = 4
+MAX_PENDING_CHECKS = 16
+
+class PasswordCheckBusy(Exception):
+    """Raised when too many password checks are already queued"""
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = threading.BoundedSemaphore(MAX_PENDING_CHECKS)
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def hash_password(password, iterations=PBKDF2_ITERATIONS):
+    """Salted PBKDF2 hash stored as algorithm$iterations$salt$digest"""
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"{PBKDF2_ALGORITHM}${iterations}${_b64(salt)}${_b64(digest)}"
+
+def verify_password(password, stored):
+    """Check a password against any supported hash, returning (ok, needs_rehash)
+
+    Besides PBKDF2 hashes this accepts the legacy formats found in existing
+    databases: unsalted SHA-256 hex digests and plaintext passwords.
+    """
+    if not stored:
+        return False, False
+    if stored.startswith(PBKDF2_ALGORITHM + "$"):
+        try:
+            _, iterations, salt, expected = stored.split("$")
+            iterations = int(iterations)
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode(), base64.b64decode(salt), iterations)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(_b64(digest), expected)
+        return ok, ok and iterations < PBKDF2_ITERATIONS
+    if len(stored) == 64 and all(char in "0123456789abcdef" for char in stored):
+        ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    else:
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+    return ok, ok
+
+def _check_and_upgrade(password, stored):
+    ok, needs_rehash = verify_password(password, stored)
+    return ok, hash_password(password) if needs_rehash else None
+
+def _run_bounded(func, *args):
+    """Run func on the hashing pool, refusing work once the pool is saturated"""
+    if not _pending.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        return _executor.submit(func, *args).result()
+    finally:
+        _pending.release()
+
+def check_password(password, stored):
+    """Verify on the bounded pool, returning (ok, new_hash_or_None)
+
+    new_hash is set when the stored hash is a legacy or weaker format and
+    should be replaced. Raises PasswordCheckBusy when the pool is saturated.
+    """
+    return _run_bounded(_check_and_upgrade, password, stored)
+
+def hash_password_bounded(password):
+    """hash_password on the bounded pool; raises PasswordCheckBusy when saturated"""
+    return _run_bounded(hash_password, password)
@@ -1,37 +1,879 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+import atexit
+import collections
+import os
 import sqlite3
 import time
+import json
+import queue
+import sys
+import threading
+
+# db, metrics, migrations and passwords live in ../shared, used by both apps
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+import metrics
+from bus_routes import BUS_ROUTES
+from db import ConnectionPool
+from eta import ALL_HOURS, SMOOTHING, EtaEngine, SegmentStats
+from fanout import MAX_BUS_ID, MAX_SEQ, PeerFanout
+from fix_frames import FRAME_MIMETYPE, FRAME_SIZE, MICRODEGREES, unpack_fixes
+from geo import GridIndex, haversine_m
+from migrations import migrate
+from passwords import PasswordCheckBusy, check_password, hash_password, hash_password_bounded
+
+try:
+    import archive
+except ImportError:  # numpy is only needed for the columnar archive
+    archive = None
 
 app = Flask(__name__)
 app.secret_key = "secret123"
 
-DB_NAME = "transport.db"
+DB_NAME = os.environ.get("TRANSPORT_DB", "transport.db")
+db = ConnectionPool(DB_NAME)
+db.init_app(app)
+metrics.init_app(app)
+MAX_BATCH_SIZE = 5000  # Upper bound on fixes accepted by /api/update_locations
+MAX_FIX_BYTES = 256  # Generous size of one JSON fix; bodies over MAX_BATCH_SIZE of these get 413 unread
+app.config["MAX_CONTENT_LENGTH"] = MAX_BATCH_SIZE * MAX_FIX_BYTES
+
+# Fix suppression: a fix closer than this to the bus's last stored fix is not stored again...
+MIN_MOVE_METRES = 10
+MAX_UNCHANGED_SECONDS = 60  # ...unless the last stored fix is at least this old
+MAX_CLOCK_SKEW_SECONDS = 300  # Device timestamps further in the future are rejected
+
+# Retention: raw fixes older than this are folded into trip_summaries
+RETENTION_DAYS = 30
+RETENTION_INTERVAL_SECONDS = 3600  # How often the retention job runs
+TRIP_GAP_SECONDS = 30 * 60  # A silence longer than this starts a new trip
+MAX_FIX_AGE_SECONDS = RETENTION_DAYS * 86400  # Older device timestamps (and 0 or negative ones) are rejected
+SUMMARY_RESOLUTION_SECONDS = 60  # Keep at most one point per minute in trip paths
+
+# Trip history API
+DEFAULT_HISTORY_POINTS = 500
+MAX_HISTORY_POINTS = 5000
+
+# Nearby buses API
+DEFAULT_NEAR_RADIUS_M = 500
+MAX_NEAR_RADIUS_M = 5000
+NEAREST_STOP_MAX_M = 1000  # Fixes further than this from every stop have no nearest stop
+
+# ETA engine: learned segment times are saved to, and reloaded from, segment_stats this often
+ETA_SYNC_SECONDS = 30
+ETA_HISTORY_DAYS = 14  # Raw history replayed by `flask learn-eta-history`
+
+# Write-behind ingest: acknowledge fixes once queued and commit them from a writer thread
+WRITE_BEHIND = os.environ.get("TRANSPORT_WRITE_BEHIND", "0") == "1"
+WRITE_QUEUE_MAX_ROWS = 50000  # Requests are refused with 503 once this many rows are waiting
+GROUP_COMMIT_ROWS = 500  # Commit as soon as this many rows are waiting...
+GROUP_COMMIT_SECONDS = 0.2  # ...or once the oldest waiting row is this old
+SHUTDOWN_FLUSH_SECONDS = 10
+
+# Multi-process deployments: workers sharing this directory exchange accepted fixes
+FANOUT_DIR = os.environ.get("TRANSPORT_FANOUT_DIR")
 
 # ---------- Database Setup ----------
+def create_schema(c):
+    # Users
+    c.execute('''CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT, password TEXT)''')
+    # Buses
+    c.execute('''CREATE TABLE IF NOT EXISTS buses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bus_number TEXT, route TEXT)''')
+    # Locations
+    c.execute('''CREATE TABLE IF NOT EXISTS locations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bus_id INTEGER NOT NULL, latitude REAL NOT NULL, longitude REAL NOT NULL,
+                    timestamp INTEGER NOT NULL)''')
+    migrate_locations(c)
+    create_location_indexes(c)
+    
+    # Compacted history produced by the retention job
+    c.execute('''CREATE TABLE IF NOT EXISTS trip_summaries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bus_id INTEGER NOT NULL,
+                    start_time INTEGER NOT NULL, end_time INTEGER NOT NULL,
+                    fix_count INTEGER NOT NULL,
+                    min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL,
+                    path TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trip_summaries_bus_time ON trip_summaries (bus_id, start_time)")
+
+def create_location_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_locations_bus_time ON locations (bus_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_locations_time ON locations (timestamp)")
+
+def create_segment_stats(c):
+    """Learned ETA segment times; hour -1 is the all-hours bucket"""
+    c.execute('''CREATE TABLE IF NOT EXISTS segment_stats (
+                    from_lat REAL NOT NULL, from_lon REAL NOT NULL,
+                    to_lat REAL NOT NULL, to_lon REAL NOT NULL,
+                    hour INTEGER NOT NULL,
+                    count INTEGER NOT NULL, mean REAL NOT NULL,
+                    PRIMARY KEY (from_lat, from_lon, to_lat, to_lon, hour)) WITHOUT ROWID''')
+
+def create_default_user(c):
+    c.execute("SELECT COUNT(*) FROM users")
+    if c.fetchone()[0] == 0:
+        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("admin", hash_password("admin123")))
+        print("Created default user: admin / admin123")
+
+# Append only: the position in this list is the schema version (PRAGMA user_version)
+MIGRATIONS = [
+    ("Create tables and indexes, converting legacy TEXT timestamps", create_schema),
+    ("Create the default admin user", create_default_user),
+    ("Persist learned ETA segment times", create_segment_stats),
+]
+
 def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
+    """Bring the database schema up to date; a single PRAGMA read when it already is"""
+    with db.connection() as conn:
+        migrate(conn, MIGRATIONS)
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending schema migrations (run once before starting workers)"""
+    init_db()
+    print("Database is up to date")
+
+def migrate_locations(c):
+    """Rebuild a legacy locations table (TEXT timestamps) with integer epoch times"""
+    c.execute("PRAGMA table_info(locations)")
+    columns = {column[1]: column[2] for column in c.fetchall()}
+    if columns.get("timestamp", "").upper() == "INTEGER":
+        return
+    print("Migrating database: converting location timestamps to integers...")
+    c.execute("DROP INDEX IF EXISTS idx_locations_bus_time")
+    c.execute("DROP INDEX IF EXISTS idx_locations_time")
+    c.execute("ALTER TABLE locations RENAME TO locations_legacy")
+    c.execute('''CREATE TABLE locations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bus_id INTEGER NOT NULL, latitude REAL NOT NULL, longitude REAL NOT NULL,
+                    timestamp INTEGER NOT NULL)''')
+    c.execute('''INSERT INTO locations (id, bus_id, latitude, longitude, timestamp)
+                 SELECT id, bus_id, latitude, longitude, CAST(timestamp AS INTEGER)
+                 FROM locations_legacy
+                 WHERE bus_id IS NOT NULL AND latitude IS NOT NULL AND longitude IS NOT NULL''')
+    c.execute("DROP TABLE locations_legacy")
+    print("Database migration completed!")
+
+# ---------- Retention ----------
+def summarize_trip(bus_id, fixes):
+    """Build a trip_summaries row from a bus's consecutive (timestamp, lat, lon) fixes"""
+    lats = [fix[1] for fix in fixes]
+    lons = [fix[2] for fix in fixes]
+    path = []
+    last_kept = None
+    for fix in fixes:
+        if last_kept is None or fix[0] - last_kept >= SUMMARY_RESOLUTION_SECONDS:
+            path.append(list(fix))
+            last_kept = fix[0]
+    if path[-1] != list(fixes[-1]):
+        path.append(list(fixes[-1]))  # Always keep where the trip ended
+    return (bus_id, fixes[0][0], fixes[-1][0], len(fixes),
+            min(lats), max(lats), min(lons), max(lons), json.dumps(path))
+
+def compact_locations(retention_days=RETENTION_DAYS):
+    """Fold raw fixes older than the retention window into trip summaries"""
+    cutoff = int(time.time()) - retention_days * 86400
+    compacted = 0
+    with db.connection() as conn:
         c = conn.cursor()
-        # Users
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        username TEXT, password TEXT)''')
-        # Buses
-        c.execute('''CREATE TABLE IF NOT EXISTS buses (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        bus_number TEXT, route TEXT)''')
-        # Locations
-        c.execute('''CREATE TABLE IF NOT EXISTS locations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        bus_id INTEGER, latitude REAL, longitude REAL, timestamp TEXT)''')
+        c.execute("SELECT DISTINCT bus_id FROM locations WHERE timestamp < ?", (cutoff,))
+        bus_ids = [row[0] for row in c.fetchall()]
+        # One short transaction per bus keeps the write lock hold time bounded
+        for bus_id in bus_ids:
+            c.execute("""SELECT timestamp, latitude, longitude FROM locations
+                         WHERE bus_id = ? AND timestamp < ? ORDER BY timestamp""", (bus_id, cutoff))
+            summaries = []
+            trip = []
+            for fix in c:
+                if trip and fix[0] - trip[-1][0] > TRIP_GAP_SECONDS:
+                    summaries.append(summarize_trip(bus_id, trip))
+                    trip = []
+                trip.append(fix)
+            if trip:
+                summaries.append(summarize_trip(bus_id, trip))
+            c.executemany('''INSERT INTO trip_summaries (bus_id, start_time, end_time, fix_count,
+                                                        min_lat, max_lat, min_lon, max_lon, path)
+                             VALUES (?,?,?,?,?,?,?,?,?)''', summaries)
+            c.execute("DELETE FROM locations WHERE bus_id = ? AND timestamp < ?", (bus_id, cutoff))
+            compacted += c.rowcount
+            conn.commit()
+    return compacted
+
+def run_retention():
+    """Archive closed days, then compact raw fixes older than the retention window"""
+    # Archive first so raw fixes reach the columnar files before they are compacted
+    if archive is not None:
+        for day, rows in archive.export_closed_days(DB_NAME).items():
+            print(f"Retention job archived {rows} location rows for {day}")
+    compacted = compact_locations()
+    if compacted:
+        print(f"Retention job compacted {compacted} location rows")
+
+def start_retention_job():
+    """Run run_retention periodically on a background thread (python app_simple.py only)"""
+    def run():
+        while True:
+            try:
+                run_retention()
+            except sqlite3.Error as e:
+                print(f"Retention job error: {e}")
+            time.sleep(RETENTION_INTERVAL_SECONDS)
+    
+    thread = threading.Thread(target=run, name="location-retention", daemon=True)
+    thread.start()
+    return thread
+
+@app.cli.command("compact-locations")
+def compact_locations_command():
+    """Archive and compact old fixes once; schedule this (e.g. hourly cron) under flask run or WSGI servers"""
+    run_retention()
+
+# ---------- Stops ----------
+def build_stop_index():
+    """Grid index over every stop in BUS_ROUTES keyed by (lat, lon); shared stops appear once"""
+    index = GridIndex()
+    stops = {}
+    for route_id, route in sorted(BUS_ROUTES.items()):
+        for stop in route["stops"]:
+            entry = stops.setdefault((stop["lat"], stop["lon"]), {"name": stop["name"], "routes": []})
+            if route_id not in entry["routes"]:
+                entry["routes"].append(route_id)
+    for (lat, lon), entry in stops.items():
+        index.update((lat, lon), lat, lon, entry)
+    return index
+
+stop_index = build_stop_index()
+
+def nearest_stop(lat, lon):
+    """Closest stop to a fix as {name, routes, distance_m}, or None if none is near"""
+    match = stop_index.nearest(lat, lon, NEAREST_STOP_MAX_M)
+    if match is None:
+        return None
+    distance, _, _, _, stop = match
+    return {"name": stop["name"], "routes": stop["routes"], "distance_m": round(distance, 1)}
+
+# ---------- Arrival Estimates ----------
+eta_engine = EtaEngine(BUS_ROUTES, stop_index)
+
+def save_segment_samples(conn, samples):
+    """Fold (from_stop, to_stop, hour, seconds) samples into segment_stats like SegmentStats.add"""
+    rows = []
+    for from_stop, to_stop, hour, seconds in samples:
+        for bucket_hour in (hour, ALL_HOURS):
+            rows.append((*from_stop, *to_stop, bucket_hour, seconds))
+    conn.executemany("""INSERT INTO segment_stats (from_lat, from_lon, to_lat, to_lon, hour, count, mean)
+                        VALUES (?, ?, ?, ?, ?, 1, ?)
+                        ON CONFLICT (from_lat, from_lon, to_lat, to_lon, hour) DO UPDATE SET
+                            count = count + 1,
+                            mean = mean + (excluded.mean - mean) * MAX(1.0 / (count + 1), ?)""",
+                     [row + (SMOOTHING,) for row in rows])
+
+def sync_eta_stats():
+    """Save this worker's new segment samples, then reload what every worker has saved"""
+    samples = eta_engine.take_unsaved()
+    try:
+        with db.connection() as conn:
+            if samples:
+                save_segment_samples(conn, samples)
+                conn.commit()
+            rows = conn.execute("""SELECT from_lat, from_lon, to_lat, to_lon, hour, count, mean
+                                   FROM segment_stats""").fetchall()
+    except sqlite3.Error:
+        eta_engine.restore_unsaved(samples)
+        raise
+    eta_engine.replace_stats(SegmentStats.from_rows(rows))
+    return len(samples)
+
+eta_sync_pid = None
+eta_sync_lock = threading.Lock()
+
+def start_eta_sync():
+    """Load learned segment times, then run sync_eta_stats periodically; once per process"""
+    global eta_sync_pid
+    with eta_sync_lock:
+        if eta_sync_pid == os.getpid():
+            return None
+        eta_sync_pid = os.getpid()
+    
+    def run():
+        while True:
+            try:
+                sync_eta_stats()
+            except sqlite3.Error as e:
+                print(f"ETA sync error: {e}")
+            time.sleep(ETA_SYNC_SECONDS)
+    
+    thread = threading.Thread(target=run, name="eta-sync", daemon=True)
+    thread.start()
+    return thread
+
+@app.before_request
+def ensure_eta_sync():
+    """Start syncing in workers run by flask run or a WSGI server, which skip __main__"""
+    if eta_sync_pid != os.getpid():
+        start_eta_sync()
+
+@atexit.register
+def save_unsaved_eta_samples():
+    samples = eta_engine.take_unsaved() if eta_sync_pid == os.getpid() else []
+    if samples:
+        try:
+            with db.connection() as conn:
+                save_segment_samples(conn, samples)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"ETA sync error: {e}")
+
+def learn_eta_history(history_days=ETA_HISTORY_DAYS):
+    """Rebuild segment_stats by replaying recent raw fixes (a one-off backfill)"""
+    since = int(time.time()) - history_days * 86400
+    engine = EtaEngine(BUS_ROUTES, stop_index)  # Replays with its own state, away from live estimates
+    with db.connection() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT bus_id, latitude, longitude, timestamp FROM locations
+                     WHERE timestamp >= ? ORDER BY bus_id, timestamp""", (since,))
+        learned = engine.learn_from_history(c)
+        c.execute("DELETE FROM segment_stats")
+        c.executemany("""INSERT INTO segment_stats (from_lat, from_lon, to_lat, to_lon, hour, count, mean)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)""", engine.stats.rows())
+        conn.commit()
+    return learned
+
+@app.cli.command("learn-eta-history")
+def learn_eta_history_command():
+    """Rebuild learned ETA segment times from the last ETA_HISTORY_DAYS of raw fixes"""
+    learned = learn_eta_history()
+    print(f"ETA engine learned {learned} segment times from history")
+
+# ---------- Live Position Store ----------
+class PositionStore:
+    """Latest known position of every bus, kept in memory, versioned and spatially indexed"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}  # bus_id -> [bus_id, latitude, longitude, timestamp]
+        self.grid = GridIndex()  # bus_id -> (lat, lon, (timestamp, nearest stop))
+        self.version = 0
+        self.loaded = False
+        self.epoch = str(int(time.time()))  # Keeps ETags unique across restarts
+        self._cached_body = None
+        self._cached_version = -1
+    
+    def update(self, records):
+        """Record new (bus_id, lat, lon, timestamp) fixes from the write path, returning the new positions"""
+        positions = [list(record) for record in records]
+        stops = [nearest_stop(lat, lon) for _, lat, lon, _ in records]
+        applied = []
+        with self.lock:
+            for position, stop in zip(positions, stops):
+                current = self.positions.get(position[0])
+                if current is not None and current[3] > position[3]:
+                    continue  # A newer fix already arrived, e.g. from another worker
+                self.positions[position[0]] = position
+                self.grid.update(position[0], position[1], position[2], (position[3], stop))
+                applied.append(position)
+            self.version += 1
+        return applied
+    
+    def ensure_loaded(self):
+        """Seed the store from the database the first time it is read"""
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            with db.connection() as conn:
+                c = conn.cursor()
+                c.execute("""SELECT bus_id, latitude, longitude, timestamp FROM locations
+                             WHERE id IN (SELECT MAX(id) FROM locations GROUP BY bus_id)""")
+                for bus_id, lat, lon, timestamp in c.fetchall():
+                    # Fixes that arrived before the first read are newer than the DB
+                    if bus_id not in self.positions:
+                        self.positions[bus_id] = [bus_id, lat, lon, timestamp]
+                        self.grid.update(bus_id, lat, lon, (timestamp, nearest_stop(lat, lon)))
+            self.version += 1
+            self.loaded = True
+    
+    def near(self, lat, lon, radius_m):
+        """Buses within radius_m of a point, nearest first"""
+        return [{"bus_id": bus_id, "latitude": bus_lat, "longitude": bus_lon, "timestamp": timestamp,
+                 "distance_m": round(distance, 1), "nearest_stop": stop}
+                for distance, bus_id, bus_lat, bus_lon, (timestamp, stop) in self.grid.near(lat, lon, radius_m)]
+    
+    def etag(self):
+        return f"{self.epoch}-{self.version}"
+    
+    def snapshot_json(self):
+        """Return (etag, JSON body), serialising at most once per version"""
+        with self.lock:
+            if self._cached_version != self.version:
+                self._cached_body = json.dumps([self.positions[bus_id] for bus_id in sorted(self.positions)])
+                self._cached_version = self.version
+            return self.etag(), self._cached_body
+
+position_store = PositionStore()
+
+# ---------- Live Position Stream ----------
+SSE_KEEPALIVE_SECONDS = 15
+# Each stream served here holds a request thread for as long as the client stays connected.
+# That suits `python app_simple.py`, but under thread-per-request workers (gunicorn sync or
+# gthread) many idle viewers would use up the workers. Such deployments run stream_server.py
+# next to the workers and send the page's stream there (TRANSPORT_STREAM_URL or a proxy
+# route). Streams here are capped per process; clients over the cap get 503 and poll.
+MAX_STREAM_SUBSCRIBERS = int(os.environ.get("TRANSPORT_MAX_STREAMS", "50"))
+STREAM_URL = os.environ.get("TRANSPORT_STREAM_URL", "/api/stream_locations")
+
+class StreamSubscriber:
+    """One Server-Sent Events client; pending updates are coalesced per bus"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.ready = threading.Event()
+    
+    def push(self, positions):
+        with self.lock:
+            for position in positions:
+                self.pending[position[0]] = position  # A slow client only sees the newest fix
+        self.ready.set()
+    
+    def wait(self, timeout):
+        """Block until updates arrive, returning them (or None on timeout)"""
+        if not self.ready.wait(timeout):
+            return None
+        with self.lock:
+            self.ready.clear()
+            pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+class LocationBroadcaster:
+    """Fans accepted fixes out to every stream subscriber from one loop"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.incoming = queue.Queue()
+        self.thread = None
+    
+    def publish(self, positions):
+        if self.subscribers:
+            self.incoming.put(positions)
+    
+    def subscribe(self):
+        """Register a new stream subscriber, or return None when the per-process cap is reached"""
+        subscriber = StreamSubscriber()
+        with self.lock:
+            if len(self.subscribers) >= MAX_STREAM_SUBSCRIBERS:
+                return None
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="location-broadcaster", daemon=True)
+                self.thread.start()
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+    
+    def _run(self):
+        while True:
+            positions = list(self.incoming.get())
+            # Drain anything else that queued up so one pass covers the backlog
+            while True:
+                try:
+                    positions.extend(self.incoming.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for subscriber in subscribers:
+                subscriber.push(positions)
+
+broadcaster = LocationBroadcaster()
+metrics.metrics.gauge("stream_subscribers", "Connected Server-Sent Events clients",
+                      lambda: len(broadcaster.subscribers))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ---------- Write-Behind Ingest ----------
+class IngestQueueFull(Exception):
+    """Raised when the write-behind queue cannot take a batch"""
+
+class WriteBehindQueue:
+    """Bounded queue of location rows committed in groups by a single writer thread"""
+    
+    def __init__(self, max_rows=WRITE_QUEUE_MAX_ROWS):
+        self.max_rows = max_rows
+        self.condition = threading.Condition()
+        self.pending = collections.deque()  # (enqueued_at, rows)
+        self.depth = 0
+        self.closed = False
+        self.thread = None
+    
+    def put(self, rows):
+        """Queue rows for insertion, or raise IngestQueueFull without queueing any"""
+        with self.condition:
+            if self.closed or self.depth + len(rows) > self.max_rows:
+                raise IngestQueueFull()
+            self.pending.append((time.monotonic(), rows))
+            self.depth += len(rows)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="location-writer", daemon=True)
+                self.thread.start()
+            self.condition.notify()  # Wakes the writer to start the deadline or commit a full group
+    
+    def _take_group(self):
+        """Wait for a full group, the commit deadline or shutdown, then take everything waiting"""
+        with self.condition:
+            while not self.closed:
+                if self.depth >= GROUP_COMMIT_ROWS:
+                    break
+                if self.pending:
+                    remaining = self.pending[0][0] + GROUP_COMMIT_SECONDS - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                else:
+                    self.condition.wait()
+            group = [row for _, rows in self.pending for row in rows]
+            self.pending.clear()
+            return group
+    
+    def _commit(self, group):
+        started = time.perf_counter()
+        with db.connection() as conn:
+            conn.executemany("INSERT INTO locations (bus_id, latitude, longitude, timestamp) VALUES (?,?,?,?)",
+                             group)
+            conn.commit()
+        metrics.metrics.observe("ingest_group_commit_seconds", "Time to commit one write-behind group",
+                                time.perf_counter() - started)
+    
+    def _run(self):
+        while True:
+            group = self._take_group()
+            if group:
+                try:
+                    self._commit(group)
+                except sqlite3.Error as e:
+                    print(f"Write-behind commit error: {e}")
+                    with self.condition:
+                        self.pending.appendleft((time.monotonic(), group))  # Retry; depth is unchanged
+                    time.sleep(1)
+                    continue
+            with self.condition:
+                self.depth -= len(group)
+                if self.closed and not self.pending:
+                    self.condition.notify_all()
+                    return
+    
+    def close(self, timeout=SHUTDOWN_FLUSH_SECONDS):
+        """Stop accepting rows and wait for everything queued to be committed"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+            if self.depth:
+                print(f"Write-behind shutdown left {self.depth} location rows uncommitted")
+
+write_queue = WriteBehindQueue()
+metrics.metrics.gauge("ingest_queue_rows", "Location rows waiting in the write-behind queue",
+                      lambda: write_queue.depth)
+if WRITE_BEHIND:
+    atexit.register(write_queue.close)
+
+def ingest_busy_response():
+    response = jsonify({"status": "error", "message": "Ingest queue is full, retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+@app.errorhandler(413)
+def body_too_large(error):
+    """Bodies over MAX_CONTENT_LENGTH are refused before they are read"""
+    return jsonify({"status": "error",
+                    "message": f"Body too large (max {MAX_BATCH_SIZE} fixes, {app.config['MAX_CONTENT_LENGTH']} bytes)"}), 413
+
+# ---------- Fix Suppression ----------
+class FixFilter:
+    """Per-bus last-seen state used to drop retried, stale and stationary fixes
+    
+    A fix is a duplicate if it repeats the last sequence number (or the last
+    timestamp and position), stale if it is older than the last fix seen, and
+    unchanged if the bus has not moved MIN_MOVE_METRES since its last stored
+    fix within MAX_UNCHANGED_SECONDS. A lower sequence number with a newer
+    timestamp is taken as the device restarting its counter.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seen = {}  # bus_id -> (timestamp, seq, lat, lon) of the last fix seen
+        self.stored = {}  # bus_id -> (timestamp, lat, lon) of the last fix stored
+    
+    def _reason(self, bus_id, lat, lon, timestamp, seq):
+        seen = self.seen.get(bus_id)
+        if seen is not None:
+            seen_timestamp, seen_seq, seen_lat, seen_lon = seen
+            if seq is not None and seen_seq is not None:
+                if seq == seen_seq:
+                    return "duplicate"
+                if seq < seen_seq and timestamp <= seen_timestamp:
+                    return "stale"
+            if timestamp < seen_timestamp:
+                return "stale"
+            if timestamp == seen_timestamp and (lat, lon) == (seen_lat, seen_lon):
+                return "duplicate"
+        self.seen[bus_id] = (timestamp, seq, lat, lon)
+        stored = self.stored.get(bus_id)
+        if (stored is not None and timestamp - stored[0] < MAX_UNCHANGED_SECONDS
+                and haversine_m(stored[1], stored[2], lat, lon) < MIN_MOVE_METRES):
+            return "unchanged"
+        self.stored[bus_id] = (timestamp, lat, lon)
+        return None
+    
+    def check(self, fixes):
+        """Return (reasons, undo) for (bus_id, lat, lon, timestamp, seq) fixes
         
-        # Create default user if none exists
-        c.execute("SELECT COUNT(*) FROM users")
-        user_count = c.fetchone()[0]
-        if user_count == 0:
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("admin", "admin123"))
-            print("Created default user: admin / admin123")
+        reasons[i] is None for fixes to store; undo() restores the previous
+        state if storing them fails so that the device's retry is not dropped.
+        """
+        with self.lock:
+            touched = {fix[0] for fix in fixes}
+            previous = {bus_id: (self.seen.get(bus_id), self.stored.get(bus_id)) for bus_id in touched}
+            reasons = [self._reason(*fix) for fix in fixes]
         
-        conn.commit()
+        def undo():
+            with self.lock:
+                for bus_id, (seen, stored) in previous.items():
+                    for state, value in ((self.seen, seen), (self.stored, stored)):
+                        if value is None:
+                            state.pop(bus_id, None)
+                        else:
+                            state[bus_id] = value
+        return reasons, undo
+
+    def remember(self, fixes):
+        """Record (bus_id, lat, lon, timestamp, seq) fixes another worker has already stored"""
+        with self.lock:
+            for bus_id, lat, lon, timestamp, seq in fixes:
+                seen = self.seen.get(bus_id)
+                if seen is None or seen[0] <= timestamp:
+                    self.seen[bus_id] = (timestamp, seq, lat, lon)
+                    self.stored[bus_id] = (timestamp, lat, lon)
+
+fix_filter = FixFilter()
+
+# ---------- Cross-Worker Fan-Out ----------
+def update_live_state(records, local=True):
+    """Apply stored (bus_id, lat, lon, timestamp) fixes to positions, streams and ETAs
+    
+    local is False for fixes ingested by another worker, which saves their ETA samples.
+    """
+    broadcaster.publish(position_store.update(records))
+    for record in records:
+        eta_engine.observe(*record, save=local)
+
+def apply_peer_fixes(fixes):
+    """Fold fixes ingested by another worker into this worker's in-memory view"""
+    fix_filter.remember(fixes)
+    update_live_state([fix[:4] for fix in fixes], local=False)
+
+fanout = PeerFanout(FANOUT_DIR, apply_peer_fixes) if FANOUT_DIR else None
+if fanout is not None:
+    fanout.start()
+    os.register_at_fork(after_in_child=fanout.start)  # Workers forked from a preloaded app
+    atexit.register(fanout.close)
+    metrics.metrics.gauge("fanout_peers", "Other workers receiving this worker's fixes",
+                          lambda: len(fanout.peers))
+
+# ---------- Location Helpers ----------
+def validate_location(item):
+    """Validate a single location fix, returning ((bus_id, lat, lon, timestamp, seq), error)
+    
+    timestamp is the device's capture time (epoch seconds) and seq its sequence
+    number; both are optional and None when absent.
+    """
+    if not isinstance(item, dict):
+        return None, "Fix must be a JSON object"
+    try:
+        bus_id = int(item["bus_id"])
+        lat = float(item["latitude"])
+        lon = float(item["longitude"])
+    except KeyError as e:
+        return None, f"Missing field: {e.args[0]}"
+    except (TypeError, ValueError, OverflowError):  # JSON allows Infinity, which int() rejects
+        return None, "bus_id, latitude and longitude must be numeric"
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, "Coordinates out of range"
+    if not 0 <= bus_id <= MAX_BUS_ID:
+        return None, "bus_id out of range"
+    try:
+        timestamp = int(item["timestamp"]) if item.get("timestamp") is not None else None
+        seq = int(item["seq"]) if item.get("seq") is not None else None
+    except (TypeError, ValueError, OverflowError):
+        return None, "timestamp and seq must be numeric"
+    if seq is not None and not 0 <= seq <= MAX_SEQ:
+        return None, "seq out of range"
+    if timestamp is not None and timestamp > time.time() + MAX_CLOCK_SKEW_SECONDS:
+        return None, "Timestamp is in the future"
+    if timestamp is not None and timestamp < max(1, time.time() - MAX_FIX_AGE_SECONDS):
+        return None, "Timestamp is older than the retention window"
+    return (bus_id, lat, lon, timestamp, seq), None
+
+def store_locations(rows):
+    """Insert validated rows in a single transaction, returning a skip reason (or None) per row
+    
+    Fixes without a device timestamp are stamped with the server time. Duplicate,
+    stale and unchanged fixes are dropped by fix_filter. In write-behind mode the
+    rows are queued for the writer thread instead and IngestQueueFull is raised
+    when the queue has no room for them.
+    """
+    now = int(time.time())
+    fixes = [(bus_id, lat, lon, now if timestamp is None else timestamp, seq)
+             for bus_id, lat, lon, timestamp, seq in rows]
+    reasons, undo = fix_filter.check(fixes)
+    records = [fix[:4] for fix, reason in zip(fixes, reasons) if reason is None]
+    for reason in reasons:
+        if reason is not None:
+            metrics.metrics.inc("locations_suppressed_total", "Location fixes dropped at ingest", reason=reason)
+    if not records:
+        return reasons
+    
+    try:
+        if WRITE_BEHIND:
+            write_queue.put(records)
+        else:
+            with db.connection() as conn:
+                conn.executemany("INSERT INTO locations (bus_id, latitude, longitude, timestamp) VALUES (?,?,?,?)",
+                                 records)
+                conn.commit()
+    except IngestQueueFull:
+        undo()
+        metrics.metrics.inc("locations_rejected_total", "Location fixes refused because the queue was full",
+                            len(records))
+        raise
+    except sqlite3.Error:
+        undo()
+        raise
+    metrics.metrics.inc("locations_ingested_total", "Location fixes stored", len(records))
+    update_live_state(records)
+    if fanout is not None:
+        fanout.publish([fix for fix, reason in zip(fixes, reasons) if reason is None])
+    return reasons
+
+def store_location_frames():
+    """Decode a binary frame body (see fix_frames.py) in bulk and store its fixes
+    
+    The response only lists rejected frames so that it stays small too.
+    """
+    body = request.get_data()
+    if len(body) // FRAME_SIZE > MAX_BATCH_SIZE:
+        return jsonify({"status": "error",
+                        "message": f"Batch too large (max {MAX_BATCH_SIZE} fixes)"}), 413
+    try:
+        frames = unpack_fixes(body)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    max_timestamp = time.time() + MAX_CLOCK_SKEW_SECONDS
+    min_timestamp = time.time() - MAX_FIX_AGE_SECONDS
+    max_lat = 90 * MICRODEGREES
+    max_lon = 180 * MICRODEGREES
+    rows = []
+    errors = []
+    for index, (bus_id, lat, lon, timestamp) in enumerate(frames):
+        if not (-max_lat <= lat <= max_lat and -max_lon <= lon <= max_lon):
+            errors.append({"index": index, "message": "Coordinates out of range"})
+        elif timestamp > max_timestamp:
+            errors.append({"index": index, "message": "Timestamp is in the future"})
+        elif timestamp and timestamp < min_timestamp:  # 0 still means "use the server's time"
+            errors.append({"index": index, "message": "Timestamp is older than the retention window"})
+        else:
+            rows.append((bus_id, lat / MICRODEGREES, lon / MICRODEGREES, timestamp or None, None))
+    
+    skipped = 0
+    if rows:
+        try:
+            skipped = sum(1 for reason in store_locations(rows) if reason)
+        except IngestQueueFull:
+            return ingest_busy_response()
+        except sqlite3.Error as e:
+            print(f"Binary location update error: {e}")
+            return jsonify({"status": "error", "message": "Could not store locations"}), 500
+    
+    return jsonify({
+        "status": "success" if not errors else "partial",
+        "accepted": len(rows) - skipped,
+        "skipped": skipped,
+        "rejected": len(errors),
+        "errors": errors
+    })
+
+def parse_location_batch():
+    """Read a batch of fixes from a JSON array or an NDJSON request body"""
+    if request.mimetype == "application/x-ndjson":
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            if len(items) == MAX_BATCH_SIZE:
+                items.append(None)  # Enough to fail the batch size check; the rest is not parsed
+                break
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # Reported as an invalid fix below
+        return items
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("locations")
+    return data if isinstance(data, list) else None
+
+# ---------- Trip History ----------
+def iter_history(bus_id, start, end):
+    """Yield (timestamp, lat, lon) for a bus in time order, streaming from the database"""
+    with db.connection() as conn:
+        c = conn.cursor()
+        # Compacted trips hold everything older than the raw rows for this bus
+        c.execute("""SELECT path FROM trip_summaries
+                     WHERE bus_id = ? AND end_time >= ? AND start_time <= ?
+                     ORDER BY start_time""", (bus_id, start, end))
+        for (path,) in c:
+            for timestamp, lat, lon in json.loads(path):
+                if start <= timestamp <= end:
+                    yield timestamp, lat, lon
+        c.execute("""SELECT timestamp, latitude, longitude FROM locations
+                     WHERE bus_id = ? AND timestamp BETWEEN ? AND ?
+                     ORDER BY timestamp""", (bus_id, start, end))
+        yield from c
+
+def decimate(points, start, end, max_points):
+    """Time-bucket decimation: keep the first fix in each bucket plus the final fix
+    
+    Buckets are sized for max_points - 1 so the final fix still fits within max_points.
+    """
+    bucket_width = max(1, -(-(end - start + 1) // (max_points - 1)))
+    last_bucket = None
+    last_point = None
+    emitted = False
+    for point in points:
+        bucket = (point[0] - start) // bucket_width
+        emitted = bucket != last_bucket
+        if emitted:
+            last_bucket = bucket
+            yield point
+        last_point = point
+    if last_point is not None and not emitted:
+        yield last_point
 
 # ---------- Routes ----------
 @app.route("/")
@@ -43,11 +885,18 @@ def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password))
-            user = c.fetchone()
-        if user:
+        try:
+            with db.connection() as conn:
+                c = conn.cursor()
+                c.execute("SELECT id, password FROM users WHERE username=?", (username,))
+                user = c.fetchone()
+                valid, new_hash = check_password(password, user[1]) if user else (False, None)
+                if valid and new_hash:
+                    # Transparently upgrade plaintext passwords from older databases
+                    c.execute("UPDATE users SET password=? WHERE id=?", (new_hash, user[0]))
+        except PasswordCheckBusy:
+            return render_template("login.html", error="The server is busy. Please try again in a moment."), 503
+        if valid:
             session["user"] = username
             return redirect(url_for("dashboard"))
         else:
@@ -72,7 +921,7 @@ def signup():
             return render_template("signup.html", error="Password must be at least 6 characters long")
         
         # Check if user already exists
-        with sqlite3.connect(DB_NAME) as conn:
+        with db.connection() as conn:
             c = conn.cursor()
             c.execute("SELECT * FROM users WHERE username=?", (username,))
             existing_user = c.fetchone()
@@ -81,7 +930,11 @@ def signup():
                 return render_template("signup.html", error="Username already exists")
             
             # Create new user
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+            try:
+                hashed_password = hash_password_bounded(password)
+            except PasswordCheckBusy:
+                return render_template("signup.html", error="The server is busy. Please try again in a moment."), 503
+            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
             conn.commit()
         
         # Auto-login after successful signup
@@ -99,7 +952,7 @@ def logout():
 def dashboard():
     if "user" not in session:
         return redirect(url_for("login"))
-    with sqlite3.connect(DB_NAME) as conn:
+    with db.connection() as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM buses")
         buses = c.fetchall()
@@ -110,7 +963,7 @@ def add_bus():
     if request.method == "POST":
         bus_number = request.form["bus_number"]
         route = request.form["route"]
-        with sqlite3.connect(DB_NAME) as conn:
+        with db.connection() as conn:
             c = conn.cursor()
             c.execute("INSERT INTO buses (bus_number, route) VALUES (?,?)", (bus_number, route))
             conn.commit()
@@ -119,32 +972,165 @@ def add_bus():
 
 @app.route("/api/update_location", methods=["POST"])
 def update_location():
-    data = request.get_json()
-    bus_id = data["bus_id"]
-    lat = data["latitude"]
-    lon = data["longitude"]
-    timestamp = str(int(time.time()))
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("INSERT INTO locations (bus_id, latitude, longitude, timestamp) VALUES (?,?,?,?)",
-                  (bus_id, lat, lon, timestamp))
-        conn.commit()
+    if request.mimetype == FRAME_MIMETYPE:
+        return store_location_frames()
+    row, error = validate_location(request.get_json(silent=True))
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    try:
+        reason = store_locations([row])[0]
+    except IngestQueueFull:
+        return ingest_busy_response()
+    if reason:
+        return jsonify({"status": "skipped", "reason": reason})  # Still a 200 so devices do not retry
     return jsonify({"status": "success"})
 
+@app.route("/api/update_locations", methods=["POST"])
+def update_locations():
+    """Accept many fixes (JSON array, NDJSON or binary frames) and store them in one transaction"""
+    if request.mimetype == FRAME_MIMETYPE:
+        return store_location_frames()
+    items = parse_location_batch()
+    if items is None:
+        return jsonify({"status": "error", "message": "Expected a JSON array of fixes"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"status": "error",
+                        "message": f"Batch too large (max {MAX_BATCH_SIZE} fixes)"}), 413
+
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+        row, error = validate_location(item)
+        if error:
+            results.append({"index": index, "status": "error", "message": error})
+        else:
+            rows.append(row)
+            results.append({"index": index, "status": "success"})
+
+    skipped = 0
+    if rows:
+        try:
+            reasons = store_locations(rows)
+        except IngestQueueFull:
+            return ingest_busy_response()
+        except sqlite3.Error as e:
+            print(f"Batch location update error: {e}")
+            return jsonify({"status": "error", "message": "Could not store locations"}), 500
+        reasons = iter(reasons)
+        for result in results:
+            if result["status"] == "success":
+                reason = next(reasons)
+                if reason:
+                    result.update(status="skipped", reason=reason)
+                    skipped += 1
+
+    return jsonify({
+        "status": "success" if len(rows) == len(items) else "partial",
+        "accepted": len(rows) - skipped,
+        "skipped": skipped,
+        "rejected": len(items) - len(rows),
+        "results": results
+    })
+
 @app.route("/track_bus")
 def track_bus():
-    return render_template("track_bus.html")
+    return render_template("track_bus.html", stream_url=STREAM_URL)
+
+@app.route("/api/buses/<int:bus_id>/history")
+def bus_history(bus_id):
+    """Downsampled path of one bus over a time range, streamed as a JSON array"""
+    now = int(time.time())
+    end = request.args.get("to", now, type=int)
+    start = request.args.get("from", end - 86400, type=int)
+    max_points = request.args.get("max_points", DEFAULT_HISTORY_POINTS, type=int)
+    if start > end:
+        return jsonify({"status": "error", "message": "'from' must not be after 'to'"}), 400
+    if not 2 <= max_points <= MAX_HISTORY_POINTS:
+        return jsonify({"status": "error",
+                        "message": f"max_points must be between 2 and {MAX_HISTORY_POINTS}"}), 400
+    
+    def generate():
+        yield "["
+        separator = ""
+        for point in decimate(iter_history(bus_id, start, end), start, end, max_points):
+            yield separator + json.dumps(point)
+            separator = ","
+        yield "]"
+    
+    return app.response_class(generate(), mimetype="application/json")
+
+@app.route("/api/buses/<int:bus_id>/eta")
+def bus_eta(bus_id):
+    """Estimated arrival at the bus's upcoming stops, precomputed on its latest fix"""
+    estimate = eta_engine.eta(bus_id)
+    if estimate is None:
+        return jsonify({"status": "error",
+                        "message": "No estimate yet: the bus has not been seen at a route stop"}), 404
+    return jsonify(dict(estimate, status="success"))
 
 @app.route("/api/get_locations")
 def get_locations():
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("SELECT bus_id, latitude, longitude, timestamp FROM locations ORDER BY id DESC LIMIT 10")
-        data = c.fetchall()
-    return jsonify(data)
+    """Current position of every bus, served from memory"""
+    position_store.ensure_loaded()
+    etag, body = position_store.snapshot_json()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # Always revalidate with If-None-Match
+    return response
+
+@app.route("/api/buses/near")
+def buses_near():
+    """Buses within `radius` metres of lat/lon, each with its nearest stop"""
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("radius", DEFAULT_NEAR_RADIUS_M, type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"status": "error", "message": "lat and lon are required and must be valid coordinates"}), 400
+    if not 0 < radius <= MAX_NEAR_RADIUS_M:
+        return jsonify({"status": "error",
+                        "message": f"radius must be between 0 and {MAX_NEAR_RADIUS_M} metres"}), 400
+    position_store.ensure_loaded()
+    buses = position_store.near(lat, lon, radius)
+    return jsonify({"status": "success", "count": len(buses), "buses": buses})
+
+@app.route("/api/stream_locations")
+def stream_locations():
+    """Server-Sent Events stream: a full snapshot, then per-bus position deltas"""
+    position_store.ensure_loaded()
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        # EventSource gives up on a non-200 response and the page falls back to polling
+        metrics.metrics.inc("stream_rejected_total", "Streams refused because the process was at its cap")
+        response = jsonify({"status": "error", "message": "Too many live streams, poll /api/get_locations"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+    _, snapshot = position_store.snapshot_json()
+    
+    def generate():
+        try:
+            yield f"retry: 3000\nevent: snapshot\ndata: {snapshot}\n\n"
+            while True:
+                positions = subscriber.wait(SSE_KEEPALIVE_SECONDS)
+                if positions is None:
+                    yield ": keepalive\n\n"
+                elif positions:
+                    yield sse_event("update", positions)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    response = app.response_class(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Stop reverse proxies from buffering the stream
+    return response
 
 # ---------- Run ----------
 if __name__ == "__main__":
     init_db()
+    start_retention_job()
+    start_eta_sync()
     print("Starting Flask server on http://127.0.0.1:5000")
     app.run(debug=True, host='127.0.0.1', port=5000)
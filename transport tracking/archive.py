@@ -0,0 +1,250 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+from bus_routes import BUS_ROUTES
+
+# ---------- Settings ----------
+ARCHIVE_DIR = os.environ.get("TRANSPORT_ARCHIVE_DIR", "archive")
+EXPORT_CHUNK_ROWS = 100000
+TRIP_GAP_SECONDS = 30 * 60  # Consecutive fixes further apart than this are not one movement
+# A day is archived only once it ended this long ago, since devices upload buffered fixes late
+ARCHIVE_GRACE_SECONDS = int(os.environ.get("TRANSPORT_ARCHIVE_GRACE_SECONDS", "86400"))
+EARTH_RADIUS_M = 6371000
+
+# One .npy file per column; rows are ordered by (bus_id, timestamp)
+COLUMNS = (("bus_id", "<u4"), ("timestamp", "<u4"), ("lat", "<f8"), ("lon", "<f8"))
+
+def day_bounds(day):
+    """UTC [start, end) epoch seconds of a datetime.date"""
+    start = int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
+    return start, start + 86400
+
+# ---------- Export ----------
+def export_day(conn, day, directory=ARCHIVE_DIR):
+    """Write one closed UTC day of locations as columnar .npy files plus index.json
+
+    The day is written to a temporary directory and renamed into place, so a
+    reader never sees a half-written day. Returns the number of rows archived.
+    """
+    start, end = day_bounds(day)
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM locations WHERE timestamp >= ? AND timestamp < ?", (start, end))
+    rows = c.fetchone()[0]
+    if not rows:
+        return 0
+
+    final_dir = os.path.join(directory, day.isoformat())
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = {name: np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode="w+",
+                                               dtype=dtype, shape=(rows,))
+               for name, dtype in COLUMNS}
+
+    c.execute("""SELECT bus_id, timestamp, latitude, longitude FROM locations
+                 WHERE timestamp >= ? AND timestamp < ? ORDER BY bus_id, timestamp""", (start, end))
+    offset = 0
+    while offset < rows:
+        chunk = c.fetchmany(EXPORT_CHUNK_ROWS)
+        if not chunk:
+            break
+        chunk = chunk[:rows - offset]  # Rows inserted since the COUNT belong to a later export
+        values = np.array(chunk, dtype=np.float64)
+        for index, (name, _) in enumerate(COLUMNS):
+            columns[name][offset:offset + len(chunk)] = values[:, index]
+        offset += len(chunk)
+
+    # Per-bus row ranges let readers slice one bus without scanning the day
+    bus_ids = columns["bus_id"][:offset]
+    boundaries = np.flatnonzero(np.diff(bus_ids)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [offset]))
+    index = {
+        "day": day.isoformat(),
+        "timezone": "UTC",
+        "rows": offset,
+        "columns": dict(COLUMNS),
+        "buses": {str(bus_ids[s]): [int(s), int(e)] for s, e in zip(starts, ends)} if offset else {},
+    }
+    for column in columns.values():
+        column.flush()
+    del columns
+    if offset < rows:
+        # Rows were deleted while exporting; shrink the files to what was written
+        for name, _ in COLUMNS:
+            path = os.path.join(tmp_dir, f"{name}.npy")
+            np.save(path, np.load(path)[:offset])
+    with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.rename(tmp_dir, final_dir)
+    return offset
+
+def archived_rows(directory, day):
+    """Rows in an archived day, or None if the day has not been archived"""
+    try:
+        with open(os.path.join(directory, day.isoformat(), "index.json")) as f:
+            return json.load(f)["rows"]
+    except FileNotFoundError:
+        return None
+
+def export_closed_days(db_path, directory=ARCHIVE_DIR, grace_seconds=ARCHIVE_GRACE_SECONDS):
+    """Archive every closed UTC day that has locations, returning {day: rows} for what was written
+
+    A day is closed once it ended grace_seconds ago. An archived day is written
+    again if fixes that arrived even later have since been stored for it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    closed_before = int(time.time()) - grace_seconds
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        archived = {}
+        start = 0
+        while True:
+            # Jump straight to the next day with data rather than walking empty days
+            first = conn.execute("SELECT MIN(timestamp) FROM locations WHERE timestamp >= ?", (start,)).fetchone()[0]
+            if first is None:
+                break
+            day = datetime.datetime.fromtimestamp(first, datetime.timezone.utc).date()
+            start, end = day_bounds(day)
+            if end > closed_before:
+                break
+            rows = archived_rows(directory, day)
+            if rows is not None:
+                stored = conn.execute("SELECT COUNT(*) FROM locations WHERE timestamp >= ? AND timestamp < ?",
+                                      (start, end)).fetchone()[0]
+                # Fewer rows than archived means the day is being compacted, not that fixes arrived
+                if stored > rows:
+                    rows = None
+            if rows is None:
+                rows = export_day(conn, day, directory)
+                if rows:
+                    archived[day.isoformat()] = rows
+            start = end
+        return archived
+    finally:
+        conn.close()
+
+# ---------- Query API ----------
+class ArchivedDay:
+    """One archived day; columns are read-only memory maps, so slicing copies nothing"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.day = self.index["day"]
+        for name, _ in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return self.index["rows"]
+
+    def bus_ids(self):
+        return [int(bus_id) for bus_id in self.index["buses"]]
+
+    def bus(self, bus_id):
+        """(timestamp, lat, lon) views for one bus, in time order"""
+        start, end = self.index["buses"].get(str(bus_id), (0, 0))
+        return self.timestamp[start:end], self.lat[start:end], self.lon[start:end]
+
+    def _steps(self):
+        """Distance (m) and duration (s) of each move between consecutive fixes of the same bus"""
+        lat = np.radians(self.lat)
+        lon = np.radians(self.lon)
+        a = (np.sin(np.diff(lat) / 2) ** 2
+             + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        duration = np.diff(self.timestamp.astype(np.int64))
+        valid = (np.diff(self.bus_id.astype(np.int64)) == 0) & (duration > 0) & (duration <= TRIP_GAP_SECONDS)
+        return distance, duration, valid
+
+    def fix_counts(self):
+        """{bus_id: number of fixes}"""
+        return {int(bus_id): end - start for bus_id, (start, end) in self.index["buses"].items()}
+
+    def average_speeds(self):
+        """{bus_id: average speed in m/s while reporting}, ignoring gaps between trips"""
+        if len(self) < 2:
+            return {}
+        distance, duration, valid = self._steps()
+        # Dense indexes rather than raw ids, which can be as large as 2**32 - 1
+        bus_ids, owner = np.unique(self.bus_id[:-1][valid], return_inverse=True)
+        metres = np.bincount(owner, weights=distance[valid], minlength=len(bus_ids))
+        seconds = np.bincount(owner, weights=duration[valid], minlength=len(bus_ids))
+        moving = np.flatnonzero(seconds)
+        return {int(bus_ids[index]): float(metres[index] / seconds[index]) for index in moving}
+
+    def time_at_stops(self, stops, radius_m=60):
+        """{stop name: seconds buses spent within radius_m}, stops given as (name, lat, lon)"""
+        if len(self) < 2:
+            return {}
+        _, duration, valid = self._steps()
+        # Equirectangular distance is accurate to well under a metre at stop-radius scale
+        lat = self.lat[:-1]
+        lon = self.lon[:-1]
+        scale = np.cos(np.radians(lat)) * np.pi * EARTH_RADIUS_M / 180
+        totals = {}
+        for name, stop_lat, stop_lon in stops:
+            near = valid & (np.hypot((lat - stop_lat) * np.pi * EARTH_RADIUS_M / 180,
+                                     (lon - stop_lon) * scale) <= radius_m)
+            totals[name] = totals.get(name, 0) + int(duration[near].sum())
+        return totals
+
+class LocationArchive:
+    """Directory of archived days written by export_closed_days"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def days(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.exists(os.path.join(self.directory, name, "index.json")))
+
+    def day(self, day):
+        return ArchivedDay(os.path.join(self.directory, str(day)))
+
+def route_stops():
+    """Every stop in BUS_ROUTES once, as (name, lat, lon)"""
+    stops = {}
+    for route in BUS_ROUTES.values():
+        for stop in route["stops"]:
+            stops.setdefault((stop["lat"], stop["lon"]), stop["name"])
+    return [(name, lat, lon) for (lat, lon), name in stops.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar archive of historical bus locations")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="Archive directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Archive every closed day not archived yet")
+    export.add_argument("--db", default="transport.db")
+    commands.add_parser("days", help="List archived days")
+    for name, help_text in (("speeds", "Average speed per bus"), ("stops", "Time spent at each stop")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("day", help="Archived day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    archive = LocationArchive(args.dir)
+    if args.command == "export":
+        for day, rows in export_closed_days(args.db, args.dir).items():
+            print(f"Archived {rows} locations for {day}")
+    elif args.command == "days":
+        for day in archive.days():
+            print(f"{day}: {len(archive.day(day))} locations")
+    elif args.command == "speeds":
+        for bus_id, speed in sorted(archive.day(args.day).average_speeds().items()):
+            print(f"Bus {bus_id}: {speed * 3.6:.1f} km/h")
+    elif args.command == "stops":
+        for name, seconds in sorted(archive.day(args.day).time_at_stops(route_stops()).items()):
+            print(f"{name}: {seconds / 60:.1f} min")
+
+if __name__ == "__main__":
+    main()
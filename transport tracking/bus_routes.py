@@ -0,0 +1,40 @@
+# Predefined bus routes with realistic coordinates
+BUS_ROUTES = {
+    1: {
+        "name": "City Center Loop",
+        "stops": [
+            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946},
+            {"name": "Mall Road", "lat": 12.9750, "lon": 77.6000},
+            {"name": "University", "lat": 12.9800, "lon": 77.6050},
+            {"name": "Hospital", "lat": 12.9850, "lon": 77.6100},
+            {"name": "Airport Road", "lat": 12.9900, "lon": 77.6150},
+            {"name": "Tech Park", "lat": 12.9950, "lon": 77.6200},
+            {"name": "Shopping Center", "lat": 13.0000, "lon": 77.6250},
+            {"name": "Residential Area", "lat": 13.0050, "lon": 77.6300},
+            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946}  # Return to start
+        ]
+    },
+    2: {
+        "name": "Airport Express",
+        "stops": [
+            {"name": "Airport Terminal", "lat": 13.1986, "lon": 77.7063},
+            {"name": "Highway Junction", "lat": 13.1500, "lon": 77.7000},
+            {"name": "Business District", "lat": 13.1000, "lon": 77.6800},
+            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946},
+            {"name": "Convention Center", "lat": 12.9500, "lon": 77.5800},
+            {"name": "Airport Terminal", "lat": 13.1986, "lon": 77.7063}  # Return to start
+        ]
+    },
+    3: {
+        "name": "University Shuttle",
+        "stops": [
+            {"name": "University Main Gate", "lat": 12.9800, "lon": 77.6050},
+            {"name": "Library", "lat": 12.9820, "lon": 77.6070},
+            {"name": "Student Center", "lat": 12.9840, "lon": 77.6090},
+            {"name": "Sports Complex", "lat": 12.9860, "lon": 77.6110},
+            {"name": "Hostel Area", "lat": 12.9880, "lon": 77.6130},
+            {"name": "Cafeteria", "lat": 12.9900, "lon": 77.6150},
+            {"name": "University Main Gate", "lat": 12.9800, "lon": 77.6050}  # Return to start
+        ]
+    }
+}
@@ -0,0 +1,201 @@
+import threading
+import time
+
+from geo import haversine_m
+
+# ---------- Settings ----------
+ARRIVAL_RADIUS_M = 60  # A fix this close to a stop counts as being at the stop
+MIN_SAMPLES = 3  # Samples needed before an hour-of-day bucket is trusted
+SMOOTHING = 0.1  # Weight of a new sample once a bucket has 1/SMOOTHING samples
+MAX_SEGMENT_SECONDS = 2 * 3600  # Longer gaps are breakdowns or depot stops, not travel; the route is re-detected
+DEFAULT_SPEED_MPS = 6.0  # About 20 km/h, used for segments with no history
+ALL_HOURS = -1  # Stored hour of a segment's all-hours bucket
+
+class SegmentStats:
+    """Running mean travel time per (from_stop, to_stop, hour_of_day)
+
+    Each sample updates its hour bucket and an all-hours bucket in O(1). The
+    mean is exact for the first 1/SMOOTHING samples and exponentially weighted
+    afterwards so it follows seasonal changes in traffic.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # (from_stop, to_stop, hour or None) -> [count, mean_seconds]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build stats from (from_lat, from_lon, to_lat, to_lon, hour, count, mean) rows"""
+        stats = cls()
+        for from_lat, from_lon, to_lat, to_lon, hour, count, mean in rows:
+            key = ((from_lat, from_lon), (to_lat, to_lon), None if hour == ALL_HOURS else hour)
+            stats.buckets[key] = [count, mean]
+        return stats
+
+    def rows(self):
+        """Buckets as rows for from_rows"""
+        for (from_stop, to_stop, hour), (count, mean) in self.buckets.items():
+            yield (*from_stop, *to_stop, ALL_HOURS if hour is None else hour, count, mean)
+
+    def add(self, from_stop, to_stop, hour, seconds):
+        for key in ((from_stop, to_stop, hour), (from_stop, to_stop, None)):
+            bucket = self.buckets.setdefault(key, [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += (seconds - bucket[1]) * max(1 / bucket[0], SMOOTHING)
+
+    def expected(self, from_stop, to_stop, hour):
+        """Return (seconds, source) for a segment, falling back from hour to all-day to distance"""
+        bucket = self.buckets.get((from_stop, to_stop, hour))
+        if bucket and bucket[0] >= MIN_SAMPLES:
+            return bucket[1], "hour"
+        bucket = self.buckets.get((from_stop, to_stop, None))
+        if bucket:
+            return bucket[1], "segment"
+        return haversine_m(*from_stop, *to_stop) / DEFAULT_SPEED_MPS, "distance"
+
+def hour_of_day(timestamp):
+    return time.localtime(timestamp).tm_hour
+
+class EtaEngine:
+    """Learns stop-to-stop travel times from fixes and keeps per-bus arrival estimates
+
+    Stops are keyed by their (lat, lon). A bus's route is inferred from the stops
+    it passes: the candidates start as every route serving the first stop and
+    narrow to the routes in which each observed stop pair is consecutive. Once
+    a bus has a stop, only the next stop of a candidate route counts as an
+    arrival, so driving past other routes' stops (or its own on the way back)
+    does not break the sequence.
+    """
+
+    def __init__(self, routes, stop_index):
+        self.routes = routes
+        self.stop_index = stop_index  # GridIndex keyed by (lat, lon)
+        self.next_stop = {}  # route_id -> {stop: following stop}
+        self.stop_names = {}  # (route_id, stop) -> name used on that route
+        self.route_lengths = {}
+        for route_id, route in routes.items():
+            following = {}
+            stops = [(stop["lat"], stop["lon"]) for stop in route["stops"]]
+            for stop, after in zip(stops, stops[1:]):
+                following.setdefault(stop, after)  # Loops list the first stop again at the end
+            self.next_stop[route_id] = following
+            self.route_lengths[route_id] = len(following)
+            for stop in route["stops"]:
+                self.stop_names.setdefault((route_id, (stop["lat"], stop["lon"])), stop["name"])
+        self.lock = threading.Lock()
+        self.stats = SegmentStats()
+        self.unsaved = []  # (from_stop, to_stop, hour, seconds) learned from this process's own fixes
+        self.states = {}  # bus_id -> tracking state, see _advance
+        self.estimates = {}  # bus_id -> precomputed ETA response
+
+    def _routes_serving(self, stop):
+        return {route_id for route_id, following in self.next_stop.items() if stop in following}
+
+    def _advance(self, state, lat, lon, timestamp):
+        """Move one bus's state forward by a fix, returning a (from, to, start, seconds) sample or None"""
+        nearby = [match[1] for match in self.stop_index.near(lat, lon, ARRIVAL_RADIUS_M)]
+        previous = state.get("stop")
+        if not nearby or previous in nearby:
+            return None
+        if previous is not None:
+            expected = {self.next_stop[route_id][previous] for route_id in state["routes"]}
+            for stop in nearby:
+                if stop in expected:
+                    sample = (previous, stop, state["arrived"], timestamp - state["arrived"])
+                    state["routes"] = {route_id for route_id in state["routes"]
+                                       if self.next_stop[route_id][previous] == stop}
+                    state["stop"] = stop
+                    state["arrived"] = timestamp
+                    return sample if 0 < sample[3] <= MAX_SEGMENT_SECONDS else None
+            if timestamp - state["arrived"] <= MAX_SEGMENT_SECONDS:
+                return None  # Passing a stop that is not next on the bus's route
+        # First stop seen, or the bus never reached its expected next stop: start over here
+        state["stop"] = nearby[0]
+        state["routes"] = self._routes_serving(nearby[0])
+        state["arrived"] = timestamp
+        return None
+
+    def _record(self, sample):
+        from_stop, to_stop, start, seconds = sample
+        self.stats.add(from_stop, to_stop, hour_of_day(start), seconds)
+        return from_stop, to_stop, hour_of_day(start), seconds
+
+    def observe(self, bus_id, lat, lon, timestamp, save=True):
+        """Feed a live fix: learn from completed segments and refresh the bus's ETAs
+
+        save is False for fixes another worker ingested; that worker saves the sample.
+        """
+        with self.lock:
+            state = self.states.setdefault(bus_id, {})
+            sample = self._advance(state, lat, lon, timestamp)
+            if sample:
+                recorded = self._record(sample)
+                if save:
+                    self.unsaved.append(recorded)
+            if state.get("routes"):
+                self.estimates[bus_id] = self._estimate(bus_id, state, lat, lon, timestamp)
+
+    def learn_from_history(self, fixes):
+        """Learn segment times from (bus_id, lat, lon, timestamp) rows ordered by bus and time
+
+        Uses its own per-bus state so replaying history never disturbs live estimates.
+        """
+        states = {}
+        count = 0
+        for bus_id, lat, lon, timestamp in fixes:
+            sample = self._advance(states.setdefault(bus_id, {}), lat, lon, timestamp)
+            if sample:
+                with self.lock:
+                    self._record(sample)
+                count += 1
+        return count
+
+    def take_unsaved(self):
+        """Hand over the samples learned since the last call, for saving"""
+        with self.lock:
+            samples, self.unsaved = self.unsaved, []
+        return samples
+
+    def restore_unsaved(self, samples):
+        """Queue samples again after they could not be saved"""
+        with self.lock:
+            self.unsaved[:0] = samples
+
+    def replace_stats(self, stats):
+        """Swap in stats loaded from storage, which include every worker's saved samples"""
+        with self.lock:
+            self.stats = stats
+
+    def _estimate(self, bus_id, state, lat, lon, timestamp):
+        """Arrival times at every remaining stop of one loop of the bus's route"""
+        route_id = min(state["routes"])
+        following = self.next_stop[route_id]
+        from_stop = state["stop"]
+        to_stop = following[from_stop]
+
+        seconds, source = self.stats.expected(from_stop, to_stop, hour_of_day(state["arrived"]))
+        remaining = seconds - (timestamp - state["arrived"])
+        if remaining <= 0:
+            # Running late: scale by the distance still to cover instead
+            segment_m = haversine_m(*from_stop, *to_stop)
+            remaining = seconds * (haversine_m(lat, lon, *to_stop) / segment_m if segment_m else 0)
+        arrival = timestamp + remaining
+
+        stops = [{"name": self.stop_names[route_id, to_stop], "arrival_time": int(arrival), "source": source}]
+        for _ in range(self.route_lengths[route_id] - 1):
+            from_stop, to_stop = to_stop, following[to_stop]
+            seconds, source = self.stats.expected(from_stop, to_stop, hour_of_day(int(arrival)))
+            arrival += seconds
+            stops.append({"name": self.stop_names[route_id, to_stop], "arrival_time": int(arrival),
+                          "source": source})
+        return {"bus_id": bus_id, "route_id": route_id, "route_name": self.routes[route_id]["name"],
+                "last_stop": self.stop_names[route_id, state["stop"]], "updated_at": timestamp, "stops": stops}
+
+    def eta(self, bus_id, now=None):
+        """Precomputed estimates for a bus with seconds-from-now filled in, or None"""
+        with self.lock:
+            estimate = self.estimates.get(bus_id)
+        if estimate is None:
+            return None
+        now = int(time.time()) if now is None else now
+        return dict(estimate, stops=[dict(stop, eta_seconds=max(0, stop["arrival_time"] - now))
+                                     for stop in estimate["stops"]])
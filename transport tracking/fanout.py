@@ -0,0 +1,122 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+from metrics import metrics
+
+# ---------- Settings ----------
+# One record per accepted fix: uint32 bus_id, float64 lat, float64 lon, uint32 timestamp, int64 seq (-1 = none)
+RECORD = struct.Struct("<IddIq")
+MAX_BUS_ID = 2 ** 32 - 1
+MAX_SEQ = 2 ** 63 - 1
+RECORDS_PER_DATAGRAM = 2048  # 64 KB, well under the default socket buffer size
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024
+SEND_TIMEOUT_SECONDS = 0.05  # A peer that cannot take a datagram within this long misses it
+PEER_REFRESH_SECONDS = 1.0  # How often the peer directory is re-read
+
+class PeerFanout:
+    """Broadcasts accepted fixes between worker processes on one host
+
+    Every worker binds a Unix datagram socket named after its pid in a shared
+    directory and sends each batch of accepted fixes to every other socket
+    there. Datagrams between local sockets are never reordered or corrupted,
+    and there is no broker process to elect or restart. A worker that has
+    exited leaves a socket nobody listens on; the first send to it fails and
+    the file is removed. A worker too slow to drain its socket within
+    SEND_TIMEOUT_SECONDS loses fixes (counted in fanout_dropped_total); its
+    view catches up with each bus's next fix.
+    """
+
+    def __init__(self, directory, on_fixes):
+        self.directory = directory
+        self.on_fixes = on_fixes  # Called with [(bus_id, lat, lon, timestamp, seq)] from other workers
+        self.pid = None
+        self.path = None
+        self.sender = None
+        self.peers = []
+        self.peers_checked = 0.0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Bind this process's socket and start receiving; safe to call again after fork"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f"{self.pid}.sock")
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # Left behind by an earlier process with the same pid
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_BYTES)
+            receiver.bind(self.path)
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_BYTES)
+            self.sender.settimeout(SEND_TIMEOUT_SECONDS)  # Never let a stuck peer stall ingest for long
+            self.peers_checked = 0.0
+        thread = threading.Thread(target=self._receive, args=(receiver,), name="fanout-receiver", daemon=True)
+        thread.start()
+
+    def close(self):
+        """Remove this process's socket so peers stop sending to it"""
+        if self.pid == os.getpid() and self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _peer_paths(self):
+        now = time.monotonic()
+        if now - self.peers_checked >= PEER_REFRESH_SECONDS:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            own = os.path.basename(self.path)
+            self.peers = [os.path.join(self.directory, name) for name in names
+                          if name.endswith(".sock") and name != own]
+            self.peers_checked = now
+        return self.peers
+
+    def publish(self, fixes):
+        """Send (bus_id, lat, lon, timestamp, seq) fixes to every other worker"""
+        if self.pid != os.getpid() or not fixes:
+            return
+        datagrams = []
+        try:
+            for start in range(0, len(fixes), RECORDS_PER_DATAGRAM):
+                chunk = fixes[start:start + RECORDS_PER_DATAGRAM]
+                datagrams.append((len(chunk), b"".join(
+                    RECORD.pack(bus_id, lat, lon, timestamp, -1 if seq is None else seq)
+                    for bus_id, lat, lon, timestamp, seq in chunk)))
+        except struct.error as e:
+            # The fixes are already stored; peers just miss them until each bus reports again
+            print(f"Fan-out pack error: {e}")
+            metrics.inc("fanout_dropped_total", "Fixes not delivered to a peer worker", len(fixes))
+            return
+        for peer in list(self._peer_paths()):
+            for count, datagram in datagrams:
+                try:
+                    self.sender.sendto(datagram, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker behind this socket has exited
+                    try:
+                        os.unlink(peer)
+                    except FileNotFoundError:
+                        pass
+                    self.peers = [path for path in self.peers if path != peer]
+                    break
+                except (BlockingIOError, socket.timeout):
+                    metrics.inc("fanout_dropped_total", "Fixes not delivered to a peer worker", count)
+                except OSError as e:
+                    print(f"Fan-out send error: {e}")
+                    metrics.inc("fanout_dropped_total", "Fixes not delivered to a peer worker", count)
+
+    def _receive(self, receiver):
+        while True:
+            datagram = receiver.recv(RECORDS_PER_DATAGRAM * RECORD.size)
+            fixes = [(bus_id, lat, lon, timestamp, None if seq < 0 else seq)
+                     for bus_id, lat, lon, timestamp, seq in RECORD.iter_unpack(datagram)]
+            try:
+                self.on_fixes(fixes)
+            except Exception as e:
+                print(f"Fan-out apply error: {e}")
@@ -0,0 +1,20 @@
+import struct
+
+# Binary location frames: a request body is any number of fixed 16-byte records
+# of little-endian (uint32 bus_id, int32 lat, int32 lon, uint32 timestamp).
+# Coordinates are micro-degrees; a timestamp of 0 means "use the server's time".
+FRAME_MIMETYPE = "application/x-bus-fixes"
+FRAME = struct.Struct("<IiiI")
+FRAME_SIZE = FRAME.size
+MICRODEGREES = 1000000
+
+def pack_fixes(fixes):
+    """Encode (bus_id, lat, lon, timestamp_or_None) fixes as one request body"""
+    return b"".join(FRAME.pack(bus_id, round(lat * MICRODEGREES), round(lon * MICRODEGREES), timestamp or 0)
+                    for bus_id, lat, lon, timestamp in fixes)
+
+def unpack_fixes(body):
+    """Iterate raw (bus_id, lat_e6, lon_e6, timestamp) tuples; raises ValueError on a truncated body"""
+    if len(body) % FRAME_SIZE:
+        raise ValueError(f"Body length must be a multiple of {FRAME_SIZE} bytes")
+    return FRAME.iter_unpack(body)
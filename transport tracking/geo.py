@@ -0,0 +1,94 @@
+import math
+import threading
+
+# ---------- Settings ----------
+EARTH_RADIUS_M = 6371000
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180  # Along a meridian
+GRID_CELL_DEGREES = 0.005  # About 550 m of latitude per cell
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+class GridIndex:
+    """Uniform lat/lon grid over moving points for radius and nearest-point queries
+
+    Each key (a bus id, a stop) lives in exactly one cell; a radius query only
+    looks at the cells overlapping the circle's bounding box and then filters
+    candidates by haversine distance.
+    """
+
+    def __init__(self, cell_degrees=GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lock = threading.Lock()
+        self.cells = {}  # (row, col) -> {key: (lat, lon, value)}
+        self.cell_of = {}  # key -> (row, col)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def __len__(self):
+        return len(self.cell_of)
+
+    def update(self, key, lat, lon, value=None):
+        """Insert or move a point"""
+        cell = self._cell(lat, lon)
+        with self.lock:
+            old_cell = self.cell_of.get(key)
+            if old_cell is not None and old_cell != cell:
+                members = self.cells[old_cell]
+                del members[key]
+                if not members:
+                    del self.cells[old_cell]
+            self.cells.setdefault(cell, {})[key] = (lat, lon, value)
+            self.cell_of[key] = cell
+
+    def remove(self, key):
+        with self.lock:
+            cell = self.cell_of.pop(key, None)
+            if cell is not None:
+                members = self.cells[cell]
+                del members[key]
+                if not members:
+                    del self.cells[cell]
+
+    def near(self, lat, lon, radius_m):
+        """Points within radius_m of (lat, lon) as (distance_m, key, lat, lon, value), nearest first"""
+        lat_span = radius_m / METRES_PER_DEGREE
+        # Longitude degrees shrink towards the poles; use the widest latitude in range
+        widest = min(89.9, abs(lat) + lat_span)
+        lon_span = min(180.0, lat_span / math.cos(math.radians(widest)))
+        min_row, min_col = self._cell(lat - lat_span, lon - lon_span)
+        max_row, max_col = self._cell(lat + lat_span, lon + lon_span)
+
+        candidates = []
+        with self.lock:
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+                # Sparse grid: walking the occupied cells is cheaper than the bounding box
+                cells = [members for (row, col), members in self.cells.items()
+                         if min_row <= row <= max_row and min_col <= col <= max_col]
+            else:
+                cells = [self.cells[(row, col)]
+                         for row in range(min_row, max_row + 1)
+                         for col in range(min_col, max_col + 1)
+                         if (row, col) in self.cells]
+            for members in cells:
+                for key, (point_lat, point_lon, value) in members.items():
+                    if abs(point_lat - lat) <= lat_span and abs(point_lon - lon) <= lon_span:
+                        candidates.append((key, point_lat, point_lon, value))
+
+        results = []
+        for key, point_lat, point_lon, value in candidates:
+            distance = haversine_m(lat, lon, point_lat, point_lon)
+            if distance <= radius_m:
+                results.append((distance, key, point_lat, point_lon, value))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def nearest(self, lat, lon, max_distance_m):
+        """Closest point within max_distance_m as (distance_m, key, lat, lon, value), or None"""
+        results = self.near(lat, lon, max_distance_m)
+        return results[0] if results else None
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from simulate_bus_enhanced import BASE_URL, BUS_ROUTES, BusTracker
+
+class HTTPConnectionPool:
+    """Minimal asyncio HTTP/1.1 client that keeps a pool of keep-alive connections"""
+    
+    def __init__(self, base_url, size):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.size = size
+        self.idle = asyncio.Queue()
+        self.slots = asyncio.Semaphore(size)
+    
+    async def _acquire(self):
+        await self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except Exception:
+                self.slots.release()
+                raise
+    
+    def _release(self, connection, reusable):
+        if reusable:
+            self.idle.put_nowait(connection)
+        else:
+            connection[1].close()
+        self.slots.release()
+    
+    async def post_json(self, path, payload):
+        """POST a JSON payload, returning (status, body)"""
+        body = json.dumps(payload).encode()
+        reader, writer = connection = await self._acquire()
+        reusable = False
+        try:
+            writer.write(f"POST {path} HTTP/1.1\r\n"
+                         f"Host: {self.host}:{self.port}\r\n"
+                         "Content-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: keep-alive\r\n\r\n".encode() + body)
+            await writer.drain()
+            
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("Server closed the connection")
+            version, status = status_line.decode().split()[:2]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            
+            if "content-length" in headers:
+                response_body = await reader.readexactly(int(headers["content-length"]))
+                connection_header = headers.get("connection", "").lower()
+                reusable = connection_header == "keep-alive" or (
+                    version == "HTTP/1.1" and connection_header != "close")
+            else:
+                response_body = await reader.read()  # Body ends when the server closes
+            return int(status), response_body
+        finally:
+            self._release(connection, reusable)
+    
+    async def close(self):
+        while not self.idle.empty():
+            _, writer = self.idle.get_nowait()
+            writer.close()
+
+class LoadStats:
+    """Collects request latencies and outcomes for the final report"""
+    
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.started = time.perf_counter()
+    
+    def record(self, latency, ok):
+        self.latencies.append(latency)
+        if not ok:
+            self.errors += 1
+    
+    def percentile(self, sorted_latencies, pct):
+        index = min(len(sorted_latencies) - 1, int(round(pct / 100 * (len(sorted_latencies) - 1))))
+        return sorted_latencies[index] * 1000
+    
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        result = {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0
+        }
+        if latencies:
+            for pct in (50, 95, 99):
+                result[f"p{pct}_ms"] = round(self.percentile(latencies, pct), 2)
+        return result
+
+async def run_bus(tracker, pool, stats, interval, jitter, deadline):
+    """Move one synthetic bus and report its position until the deadline"""
+    # Spread start times so the fleet does not report in lock-step
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.perf_counter() < deadline:
+        tracker.move_to_next_stop()
+        started = time.perf_counter()
+        try:
+            status, _ = await pool.post_json("/api/update_location", tracker.location_payload())
+            stats.record(time.perf_counter() - started, status == 200)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            stats.record(time.perf_counter() - started, False)
+            print(f"Error sending location for bus {tracker.bus_id}: {e}")
+        delay = interval * random.uniform(1 - jitter, 1 + jitter)
+        await asyncio.sleep(max(0.0, min(delay, deadline - time.perf_counter())))
+
+async def report_progress(stats, every):
+    while True:
+        await asyncio.sleep(every)
+        print(json.dumps(stats.report()))
+
+async def run_load_test(args):
+    pool = HTTPConnectionPool(args.url, args.connections)
+    stats = LoadStats()
+    deadline = time.perf_counter() + args.duration
+    route_ids = sorted(BUS_ROUTES)
+    trackers = [BusTracker(bus_id, route_id=route_ids[bus_id % len(route_ids)], verbose=False)
+                for bus_id in range(args.first_bus_id, args.first_bus_id + args.buses)]
+    
+    print(f"Simulating {len(trackers)} buses for {args.duration}s "
+          f"({args.interval}s ± {args.jitter:.0%} between updates, {args.connections} connections)")
+    progress = asyncio.create_task(report_progress(stats, args.report_every))
+    try:
+        await asyncio.gather(*(run_bus(tracker, pool, stats, args.interval, args.jitter, deadline)
+                               for tracker in trackers))
+    finally:
+        progress.cancel()
+        await pool.close()
+    return stats.report()
+
+def main():
+    parser = argparse.ArgumentParser(description="Asynchronous multi-bus load generator")
+    parser.add_argument("--url", default=BASE_URL, help="Tracking server base URL")
+    parser.add_argument("--buses", type=int, default=1000, help="Number of synthetic buses")
+    parser.add_argument("--first-bus-id", type=int, default=1, help="Bus ID of the first synthetic bus")
+    parser.add_argument("--interval", type=float, default=3.0, help="Seconds between updates per bus")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction applied to the interval")
+    parser.add_argument("--duration", type=float, default=60.0, help="Test length in seconds")
+    parser.add_argument("--connections", type=int, default=50, help="Size of the keep-alive connection pool")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+    
+    try:
+        result = asyncio.run(run_load_test(args))
+        print("\nFinal results:")
+        print(json.dumps(result, indent=2))
+    except KeyboardInterrupt:
+        print("\nSimulator stopped by user")
+
+if __name__ == "__main__":
+    main()
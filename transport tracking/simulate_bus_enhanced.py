@@ -3,79 +3,59 @@ import time
 import sqlite3
 import json
 import math
+import argparse
+
+from bus_routes import BUS_ROUTES
+from fix_frames import FRAME_MIMETYPE, MICRODEGREES, pack_fixes
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for the vectorized fleet engine
+    np = None
 
 # Flask backend URL
 BASE_URL = "http://127.0.0.1:5000"
 
-# Predefined bus routes with realistic coordinates
-BUS_ROUTES = {
-    1: {
-        "name": "City Center Loop",
-        "stops": [
-            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946},
-            {"name": "Mall Road", "lat": 12.9750, "lon": 77.6000},
-            {"name": "University", "lat": 12.9800, "lon": 77.6050},
-            {"name": "Hospital", "lat": 12.9850, "lon": 77.6100},
-            {"name": "Airport Road", "lat": 12.9900, "lon": 77.6150},
-            {"name": "Tech Park", "lat": 12.9950, "lon": 77.6200},
-            {"name": "Shopping Center", "lat": 13.0000, "lon": 77.6250},
-            {"name": "Residential Area", "lat": 13.0050, "lon": 77.6300},
-            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946}  # Return to start
-        ]
-    },
-    2: {
-        "name": "Airport Express",
-        "stops": [
-            {"name": "Airport Terminal", "lat": 13.1986, "lon": 77.7063},
-            {"name": "Highway Junction", "lat": 13.1500, "lon": 77.7000},
-            {"name": "Business District", "lat": 13.1000, "lon": 77.6800},
-            {"name": "Central Station", "lat": 12.9716, "lon": 77.5946},
-            {"name": "Convention Center", "lat": 12.9500, "lon": 77.5800},
-            {"name": "Airport Terminal", "lat": 13.1986, "lon": 77.7063}  # Return to start
-        ]
-    },
-    3: {
-        "name": "University Shuttle",
-        "stops": [
-            {"name": "University Main Gate", "lat": 12.9800, "lon": 77.6050},
-            {"name": "Library", "lat": 12.9820, "lon": 77.6070},
-            {"name": "Student Center", "lat": 12.9840, "lon": 77.6090},
-            {"name": "Sports Complex", "lat": 12.9860, "lon": 77.6110},
-            {"name": "Hostel Area", "lat": 12.9880, "lon": 77.6130},
-            {"name": "Cafeteria", "lat": 12.9900, "lon": 77.6150},
-            {"name": "University Main Gate", "lat": 12.9800, "lon": 77.6050}  # Return to start
-        ]
-    }
-}
+# Reuse one keep-alive connection for every request
+http = requests.Session()
+
+def loop_stops(route):
+    """A route's stops as a cycle; loop routes list their first stop again at the end"""
+    stops = route["stops"]
+    if len(stops) > 2 and stops[0] == stops[-1]:
+        return stops[:-1]  # Wrapping to index 0 already returns there
+    return stops
 
 class BusTracker:
-    def __init__(self, bus_id):
+    def __init__(self, bus_id, route_id=None, verbose=True):
         self.bus_id = bus_id
-        self.route = BUS_ROUTES.get(bus_id, BUS_ROUTES[1])  # Default to route 1
+        self.route = BUS_ROUTES.get(route_id or bus_id, BUS_ROUTES[1])  # Default to route 1
+        self.stops = loop_stops(self.route)
+        self.verbose = verbose
         self.current_stop_index = 0
         self.next_stop_index = 1
-        self.current_position = self.route["stops"][0].copy()
+        self.current_position = self.stops[0].copy()
         self.speed = 0.0001  # Movement speed (degrees per update)
         self.update_interval = 3  # seconds between updates
         
     def move_to_next_stop(self):
         """Move the bus towards the next stop"""
-        current_stop = self.route["stops"][self.current_stop_index]
-        next_stop = self.route["stops"][self.next_stop_index]
+        next_stop = self.stops[self.next_stop_index]
         
-        # Calculate direction vector
-        lat_diff = next_stop["lat"] - current_stop["lat"]
-        lon_diff = next_stop["lon"] - current_stop["lon"]
+        # Calculate direction vector from where the bus is now
+        lat_diff = next_stop["lat"] - self.current_position["lat"]
+        lon_diff = next_stop["lon"] - self.current_position["lon"]
         
-        # Calculate distance
+        # Calculate remaining distance to the stop
         distance = math.sqrt(lat_diff**2 + lon_diff**2)
         
-        if distance < self.speed:
+        if distance <= self.speed:
             # Reached the next stop
             self.current_stop_index = self.next_stop_index
-            self.next_stop_index = (self.next_stop_index + 1) % len(self.route["stops"])
+            self.next_stop_index = (self.next_stop_index + 1) % len(self.stops)
             self.current_position = next_stop.copy()
-            print(f"Bus {self.bus_id} reached {next_stop['name']}")
+            if self.verbose:
+                print(f"Bus {self.bus_id} reached {next_stop['name']}")
         else:
             # Move towards next stop
             move_lat = (lat_diff / distance) * self.speed
@@ -84,17 +64,21 @@ class BusTracker:
             self.current_position["lat"] += move_lat
             self.current_position["lon"] += move_lon
     
-    def send_location_update(self):
-        """Send current location to the server"""
-        data = {
+    def location_payload(self):
+        """Current location in the format expected by the server"""
+        return {
             "bus_id": self.bus_id,
             "latitude": self.current_position["lat"],
             "longitude": self.current_position["lon"]
         }
+    
+    def send_location_update(self):
+        """Send current location to the server"""
+        data = self.location_payload()
         
         try:
-            response = requests.post(f"{BASE_URL}/api/update_location", json=data)
-            stop_name = self.route["stops"][self.current_stop_index]["name"]
+            response = http.post(f"{BASE_URL}/api/update_location", json=data)
+            stop_name = self.stops[self.current_stop_index]["name"]
             print(f"Bus {self.bus_id} ({self.route['name']}) at {stop_name}: "
                   f"({self.current_position['lat']:.6f}, {self.current_position['lon']:.6f})")
             return True
@@ -102,6 +86,113 @@ class BusTracker:
             print(f"Error sending location for bus {self.bus_id}: {e}")
             return False
 
+class FleetEngine:
+    """Moves a whole fleet along BUS_ROUTES with one vectorized NumPy step per tick"""
+    
+    def __init__(self, bus_ids, speed=0.0001 / 3, speed_variation=0.2, seed=None):
+        if np is None:
+            raise RuntimeError("The fleet engine requires numpy (pip install numpy)")
+        rng = np.random.default_rng(seed)
+        
+        # Flatten every route's stops into shared arrays indexed by route offset
+        route_ids = sorted(BUS_ROUTES)
+        stop_lat, stop_lon, offsets, lengths = [], [], [], []
+        for route_id in route_ids:
+            stops = loop_stops(BUS_ROUTES[route_id])
+            offsets.append(len(stop_lat))
+            lengths.append(len(stops))
+            stop_lat.extend(stop["lat"] for stop in stops)
+            stop_lon.extend(stop["lon"] for stop in stops)
+        self.stop_lat = np.array(stop_lat)
+        self.stop_lon = np.array(stop_lon)
+        self.stop_names = [stop["name"] for route_id in route_ids for stop in loop_stops(BUS_ROUTES[route_id])]
+        
+        # Per-bus state
+        self.bus_ids = np.asarray(bus_ids, dtype=np.int64)
+        count = len(self.bus_ids)
+        route_index = np.arange(count) % len(route_ids)
+        self.route_offset = np.array(offsets)[route_index]
+        self.route_length = np.array(lengths)[route_index]
+        self.next_stop = np.ones(count, dtype=np.int64)
+        self.lat = self.stop_lat[self.route_offset].copy()
+        self.lon = self.stop_lon[self.route_offset].copy()
+        self.speed = speed * rng.uniform(1 - speed_variation, 1 + speed_variation, count)  # degrees per second
+    
+    def step(self, dt):
+        """Advance every bus by dt seconds, returning the indices of buses that reached a stop"""
+        target = self.route_offset + self.next_stop
+        lat_diff = self.stop_lat[target] - self.lat
+        lon_diff = self.stop_lon[target] - self.lon
+        distance = np.hypot(lat_diff, lon_diff)
+        travel = self.speed * dt
+        
+        arrived = distance <= travel
+        moving = ~arrived
+        scale = travel[moving] / distance[moving]
+        self.lat[moving] += lat_diff[moving] * scale
+        self.lon[moving] += lon_diff[moving] * scale
+        
+        self.lat[arrived] = self.stop_lat[target[arrived]]
+        self.lon[arrived] = self.stop_lon[target[arrived]]
+        self.next_stop[arrived] = (self.next_stop[arrived] + 1) % self.route_length[arrived]
+        return np.flatnonzero(arrived)
+    
+    def stop_name(self, index):
+        """Name of the stop a bus last reached"""
+        previous = (self.next_stop[index] - 1) % self.route_length[index]
+        return self.stop_names[self.route_offset[index] + previous]
+    
+    def payloads(self, start=0, end=None):
+        """Location payloads for a slice of the fleet"""
+        return [{"bus_id": bus_id, "latitude": lat, "longitude": lon}
+                for bus_id, lat, lon in zip(self.bus_ids[start:end].tolist(),
+                                            self.lat[start:end].tolist(),
+                                            self.lon[start:end].tolist())]
+    
+    def frames(self, start=0, end=None, timestamp=None):
+        """Binary location frames for a slice of the fleet, packed in one NumPy pass"""
+        ids = self.bus_ids[start:end]
+        frames = np.empty(len(ids), dtype=[("bus_id", "<u4"), ("lat", "<i4"), ("lon", "<i4"), ("timestamp", "<u4")])
+        frames["bus_id"] = ids
+        frames["lat"] = np.round(self.lat[start:end] * MICRODEGREES)
+        frames["lon"] = np.round(self.lon[start:end] * MICRODEGREES)
+        frames["timestamp"] = int(time.time()) if timestamp is None else timestamp
+        return frames.tobytes()
+
+def send_batch_update(trackers, binary=False):
+    """Send the locations of every bus in a single request"""
+    payload = [tracker.location_payload() for tracker in trackers]
+    if binary:
+        timestamp = int(time.time())
+        return send_frames(pack_fixes((item["bus_id"], item["latitude"], item["longitude"], timestamp)
+                                      for item in payload), len(payload))
+    return send_payloads(payload)
+
+def report_batch(response, count):
+    result = response.json()
+    print(f"Sent {count} locations ({len(response.request.body)} bytes): {result.get('accepted', 0)} accepted, "
+          f"{result.get('rejected', 0)} rejected")
+    return response.ok
+
+def send_payloads(payload):
+    """POST a list of location payloads to the batch endpoint"""
+    try:
+        response = http.post(f"{BASE_URL}/api/update_locations", json=payload)
+        return report_batch(response, len(payload))
+    except Exception as e:
+        print(f"Error sending batch location update: {e}")
+        return False
+
+def send_frames(body, count):
+    """POST packed binary location frames to the batch endpoint"""
+    try:
+        response = http.post(f"{BASE_URL}/api/update_locations", data=body,
+                             headers={"Content-Type": FRAME_MIMETYPE})
+        return report_batch(response, count)
+    except Exception as e:
+        print(f"Error sending binary location update: {e}")
+        return False
+
 def get_or_create_buses():
     """Get buses from database and create default ones if needed"""
     buses = []
@@ -139,7 +230,45 @@ def get_or_create_buses():
     
     return buses
 
+def run_fleet(count, first_bus_id, interval, batch_size, binary=False):
+    """Simulate a large synthetic fleet with the vectorized engine"""
+    engine = FleetEngine(range(first_bus_id, first_bus_id + count))
+    print(f"Simulating {count} synthetic buses (updates every {interval}s)")
+    print("Press Ctrl+C to stop\n")
+    
+    try:
+        while True:
+            started = time.perf_counter()
+            arrived = engine.step(interval)
+            for index in arrived[:5]:
+                print(f"Bus {engine.bus_ids[index]} reached {engine.stop_name(index)}")
+            if len(arrived) > 5:
+                print(f"... and {len(arrived) - 5} more arrivals")
+            
+            for start in range(0, count, batch_size):
+                if binary:
+                    send_frames(engine.frames(start, start + batch_size), min(batch_size, count - start))
+                else:
+                    send_payloads(engine.payloads(start, start + batch_size))
+            
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    except KeyboardInterrupt:
+        print("\nSimulator stopped by user")
+
 def main():
+    parser = argparse.ArgumentParser(description="Enhanced bus location simulator")
+    parser.add_argument("--fleet", type=int, default=0,
+                        help="Simulate this many synthetic buses with the vectorized engine")
+    parser.add_argument("--first-bus-id", type=int, default=1, help="Bus ID of the first synthetic bus")
+    parser.add_argument("--interval", type=float, default=3.0, help="Seconds between updates")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Fixes per batch request")
+    parser.add_argument("--binary", action="store_true", help="Send compact binary frames instead of JSON")
+    args = parser.parse_args()
+    
+    if args.fleet:
+        run_fleet(args.fleet, args.first_bus_id, args.interval, args.batch_size, args.binary)
+        return
+    
     print("Starting Enhanced Bus Location Simulator...")
     print("This simulator creates realistic bus routes without GPS devices")
     
@@ -163,7 +292,9 @@ def main():
         while True:
             for bus_id, tracker in trackers.items():
                 tracker.move_to_next_stop()
-                tracker.send_location_update()
+            
+            # Flush the whole tick in one round trip
+            send_batch_update(trackers.values(), args.binary)
             
             time.sleep(3)  # Update every 3 seconds
             
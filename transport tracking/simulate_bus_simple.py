@@ -2,6 +2,9 @@ import requests
 import time
 import random
 import sqlite3
+import argparse
+
+from fix_frames import FRAME_MIMETYPE, pack_fixes
 
 # Flask backend URL
 BASE_URL = "http://127.0.0.1:5000"
@@ -24,6 +27,10 @@ def get_or_create_bus():
         print(f"Error accessing database: {e}")
         return 1  # Fallback to bus ID 1
 
+parser = argparse.ArgumentParser(description="Single bus location simulator")
+parser.add_argument("--binary", action="store_true", help="Send compact binary frames instead of JSON")
+args = parser.parse_args()
+
 # Get bus ID
 BUS_ID = get_or_create_bus()
 print(f"Using Bus ID: {BUS_ID}")
@@ -31,6 +38,8 @@ print(f"Using Bus ID: {BUS_ID}")
 # Starting location (Example: Bangalore coordinates)
 lat, lon = 12.9716, 77.5946
 
+seq = 0  # Lets the server drop retried and out-of-order fixes
+
 print("Starting bus location simulator...")
 print("Press Ctrl+C to stop")
 
@@ -40,17 +49,30 @@ try:
         lat += random.uniform(-0.001, 0.001)
         lon += random.uniform(-0.001, 0.001)
 
+        seq += 1
         data = {
             "bus_id": BUS_ID,
             "latitude": lat,
-            "longitude": lon
+            "longitude": lon,
+            "timestamp": int(time.time()),  # Capture time, kept if the fix is delivered late
+            "seq": seq
         }
 
-        try:
-            res = requests.post(f"{BASE_URL}/api/update_location", json=data)
-            print(f"Sent: Bus {BUS_ID} at ({lat:.6f}, {lon:.6f}) - Response: {res.json()}")
-        except Exception as e:
-            print(f"Error sending location: {e}")
+        # Retrying the same payload is safe: the server drops it if it already arrived
+        for attempt in range(3):
+            try:
+                if args.binary:
+                    # Binary frames carry no sequence number; duplicates are caught by timestamp and position
+                    body = pack_fixes([(BUS_ID, lat, lon, data["timestamp"])])
+                    res = requests.post(f"{BASE_URL}/api/update_location", data=body, timeout=5,
+                                        headers={"Content-Type": FRAME_MIMETYPE})
+                else:
+                    res = requests.post(f"{BASE_URL}/api/update_location", json=data, timeout=5)
+                print(f"Sent: Bus {BUS_ID} at ({lat:.6f}, {lon:.6f}) - Response: {res.json()}")
+                break
+            except Exception as e:
+                print(f"Error sending location (attempt {attempt + 1}): {e}")
+                time.sleep(1)
 
         time.sleep(5)  # send update every 5 seconds
 
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import sqlite3
+import sys
+
+# db, metrics, migrations and passwords live in ../shared, used by both apps
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+from fanout import PeerFanout
+
+# Serves /api/stream_locations for deployments whose Flask workers are thread-per-request
+# (gunicorn sync/gthread), where every open stream would hold a whole worker thread.
+# This process joins the workers' fan-out directory (TRANSPORT_FANOUT_DIR) as one more
+# peer, so it receives every accepted fix, and serves Server-Sent Events to any number of
+# idle clients from a single asyncio loop. Route /api/stream_locations to it from the
+# reverse proxy, or point the page at it with TRANSPORT_STREAM_URL.
+
+# ---------- Settings ----------
+STREAM_PATH = "/api/stream_locations"
+FLUSH_SECONDS = 0.2  # Fixes arriving within this window go out as one update event
+SSE_KEEPALIVE_SECONDS = 15
+MAX_CLIENT_BUFFER_BYTES = 1024 * 1024  # A client this far behind is dropped and resyncs on reconnect
+MAX_REQUEST_HEADER_LINES = 100
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class StreamHub:
+    """Latest position of every bus and the connected clients; only touched from the event loop
+
+    Updates are serialised once per flush and the same bytes are written to every
+    client, so the cost of a fix does not grow with per-client work.
+    """
+
+    def __init__(self):
+        self.positions = {}  # bus_id -> [bus_id, latitude, longitude, timestamp]
+        self.pending = {}  # Positions changed since the last flush
+        self.clients = set()
+        self._snapshot = None
+
+    def load(self, db_path):
+        """Seed positions with each bus's latest stored fix"""
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            c = conn.execute("""SELECT bus_id, latitude, longitude, timestamp FROM locations
+                                WHERE id IN (SELECT MAX(id) FROM locations GROUP BY bus_id)""")
+            for bus_id, lat, lon, timestamp in c:
+                self.positions[bus_id] = [bus_id, lat, lon, timestamp]
+        finally:
+            conn.close()
+        self._snapshot = None
+
+    def apply(self, fixes):
+        """Fold (bus_id, lat, lon, timestamp, seq) fixes from the workers into the positions"""
+        for bus_id, lat, lon, timestamp, _ in fixes:
+            current = self.positions.get(bus_id)
+            if current is not None and current[3] > timestamp:
+                continue  # A newer fix already arrived
+            position = [bus_id, lat, lon, timestamp]
+            self.positions[bus_id] = position
+            self.pending[bus_id] = position
+        self._snapshot = None
+
+    def snapshot(self):
+        """The full-snapshot event a new client starts from, serialised at most once per change"""
+        if self._snapshot is None:
+            body = json.dumps([self.positions[bus_id] for bus_id in sorted(self.positions)])
+            self._snapshot = f"retry: 3000\nevent: snapshot\ndata: {body}\n\n".encode()
+        return self._snapshot
+
+    def broadcast(self, data):
+        for writer in list(self.clients):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER_BYTES:
+                self.clients.discard(writer)
+                writer.close()
+            else:
+                writer.write(data)
+
+    async def run(self):
+        """Flush pending positions to every client, sending keepalives when idle"""
+        idle = 0.0
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            if self.pending:
+                positions, self.pending = list(self.pending.values()), {}
+                self.broadcast(sse_event("update", positions).encode())
+                idle = 0.0
+            else:
+                idle += FLUSH_SECONDS
+                if idle >= SSE_KEEPALIVE_SECONDS:
+                    self.broadcast(b": keepalive\n\n")
+                    idle = 0.0
+
+async def read_request(reader):
+    """Return (method, path) of an HTTP request, discarding its headers"""
+    request_line = await reader.readline()
+    parts = request_line.decode("latin-1").split()
+    for _ in range(MAX_REQUEST_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+    if len(parts) < 2:
+        return None, None
+    return parts[0], parts[1].split("?", 1)[0]
+
+async def handle_client(hub, reader, writer):
+    try:
+        method, path = await read_request(reader)
+        if method != "GET" or path != STREAM_PATH:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"X-Accel-Buffering: no\r\n"
+                     b"Access-Control-Allow-Origin: *\r\n"
+                     b"Connection: close\r\n\r\n")
+        writer.write(hub.snapshot())
+        hub.clients.add(writer)
+        # Nothing more is expected from the client; this returns when it disconnects
+        while await reader.read(4096):
+            pass
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        hub.clients.discard(writer)
+        writer.close()
+
+async def serve(host, port, db_path, fanout_dir):
+    loop = asyncio.get_running_loop()
+    hub = StreamHub()
+    hub.load(db_path)
+    fanout = PeerFanout(fanout_dir, lambda fixes: loop.call_soon_threadsafe(hub.apply, fixes))
+    fanout.start()
+    atexit.register(fanout.close)
+    server = await asyncio.start_server(lambda reader, writer: handle_client(hub, reader, writer), host, port,
+                                        backlog=1024)
+    print(f"Streaming bus positions on http://{host}:{port}{STREAM_PATH} ({len(hub.positions)} buses loaded)")
+    async with server:
+        await asyncio.gather(server.serve_forever(), hub.run())
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve live bus positions over Server-Sent Events")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--db", default=os.environ.get("TRANSPORT_DB", "transport.db"))
+    parser.add_argument("--fanout-dir", default=os.environ.get("TRANSPORT_FANOUT_DIR"),
+                        help="Directory shared with the app workers (TRANSPORT_FANOUT_DIR)")
+    args = parser.parse_args()
+    if not args.fanout_dir:
+        parser.error("--fanout-dir or TRANSPORT_FANOUT_DIR is required to receive fixes from the workers")
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, args.fanout_dir))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()